@@ -14,9 +14,20 @@ if missing_secrets:
 
 # --- 2. IMPORT MODULES ---
 from engine.core import ScoreEngine, RunMetrics
-from services.api import StravaService, WeatherService, AICoachService
-from services.db import DatabaseService
-from ui.visuals import render_benchmark_chart, render_zones_chart, render_scatter_chart, render_history_table, render_trend_chart
+from engine.percentile import PercentileService
+from engine.calibration import CalibrationLab, default_grid
+from engine.load import TrainingLoad
+from engine.power_curve import PowerCurveEnvelope, mean_max_power
+from engine.intervals import detect_intervals
+from engine.similarity import RunIndex
+from engine.streams import resample_streams
+from engine.cleaning import clean_streams
+from engine.digest import BaselineIndex, build_digest, is_current
+from engine.synthetic import generate_history, synthetic_streams
+from services.api import StravaService, AICoachService, coalescing_stats
+from services.db import create_database_service
+from services.sync import SyncPipeline, plan_sync
+from ui.visuals import render_benchmark_chart, render_zones_chart, render_scatter_chart, render_history_table, render_trend_chart, render_drift_chart, render_power_curve_chart, render_segments_chart
 from ui.style import apply_custom_style
 
 # --- 3. PAGE SETUP ---
@@ -26,13 +37,48 @@ apply_custom_style()
 # --- 4. SERVICES INIT ---
 # Secrets are guaranteed to exist by check_secrets()
 strava_creds = Config.get_strava_creds()
-supa_creds = Config.get_supabase_creds()
 gemini_key = Config.get_gemini_key()
 
+@st.cache_resource(show_spinner=False)
+def get_database_service():
+    """Backend di storage (Supabase, SQLite locale o cache locale + Supabase), uno per processo."""
+    return create_database_service()
+
 auth_svc = StravaService(strava_creds["client_id"], strava_creds["client_secret"])
-db_svc = DatabaseService(supa_creds["url"], supa_creds["key"])
+db_svc = get_database_service()
+
+@st.cache_resource(show_spinner=False)
+def load_percentile_index():
+    """Indice percentile condiviso tra le sessioni: costruito una volta, poi aggiornato ad ogni sync."""
+    return PercentileService().build(db_svc.get_score_population())
+
+pct_index = load_percentile_index()
+
+@st.cache_data(show_spinner=False, max_entries=500)
+def get_drift_curve(run_id, _watts, _hr, dt=1.0):
+    """Curva di deriva per le corse salvate prima che venisse calcolata in sync (cache per run)."""
+    return ScoreEngine().calculate_drift_curve(_watts, _hr, dt=dt)
 
-import concurrent.futures
+@st.cache_data(show_spinner="Generazione storico demo...")
+def load_demo_history(n_runs, seed):
+    return generate_history(n_runs, seed)
+
+def load_athlete_models(aid, ftp):
+    """
+    Modelli incrementali persistiti (CTL/ATL/TSB, inviluppo potenza):
+    se mancano vengono ricostruiti una volta con il backfill e salvati.
+    """
+    ath_state = db_svc.get_athlete_state(aid)
+    tl = TrainingLoad.from_dict(ath_state.get("load"))
+    env = PowerCurveEnvelope.from_dict(ath_state.get("power_curve"))
+    if not ath_state.get("load") or env is None:
+        if not ath_state.get("load"):
+            tl, _ = TrainingLoad.backfill(db_svc.get_run_summaries(aid), ftp)
+        if env is None:
+            env = PowerCurveEnvelope.build(db_svc.get_run_curves(aid)) # Tutto lo storico dell'atleta, senza stream
+        ath_state.update({"load": tl.to_dict(), "power_curve": env.to_dict()})
+        db_svc.save_athlete_state(aid, ath_state)
+    return tl, env
 
 # --- 5. STATE MANAGEMENT ---
 if "strava_token" not in st.session_state: st.session_state.strava_token = None
@@ -60,12 +106,14 @@ with col_prof:
         st.markdown(f"<div style='text-align:right'><strong>{ath.get('firstname')} {ath.get('lastname')}</strong></div>", unsafe_allow_html=True)
         if st.button("Logout", key="logout"):
             st.session_state.strava_token = None
+            for k in ("training_load", "power_envelope", "run_index"): st.session_state.pop(k, None)
             st.rerun()
     elif st.session_state.demo_mode:
         st.markdown(f"<div style='text-align:right'><strong>Utente Demo</strong></div>", unsafe_allow_html=True)
         if st.button("Esci Demo"):
             st.session_state.demo_mode = False
             st.session_state.data = []
+            for k in ("training_load", "power_envelope", "run_index"): st.session_state.pop(k, None)
             st.rerun()
     else:
         c_login, c_demo = st.columns([3, 2])
@@ -74,12 +122,8 @@ with col_prof:
         with c_demo:
             if st.button("👀 Demo", use_container_width=True):
                 st.session_state.demo_mode = True
-                # Carica dati finti
-                st.session_state.data = [
-                    {"id": 101, "Data": datetime.now()-timedelta(days=1), "Dist (km)": 10.5, "Power": 240, "HR": 155, "Decoupling": 3.2, "SCORE": 0.29, "Rank": "🥇 Pro", "WR_Pct": 76.5, "Meteo": "18.5°C", "raw_watts": [240]*2000, "raw_hr": [155]*2000},
-                    {"id": 102, "Data": datetime.now()-timedelta(days=3), "Dist (km)": 21.1, "Power": 230, "HR": 160, "Decoupling": 6.5, "SCORE": 0.31, "Rank": "🏆 Elite", "WR_Pct": 73.0, "Meteo": "22.0°C", "raw_watts": [230]*4000, "raw_hr": [160]*4000},
-                    {"id": 103, "Data": datetime.now()-timedelta(days=6), "Dist (km)": 5.0, "Power": 260, "HR": 165, "Decoupling": 1.1, "SCORE": 0.18, "Rank": "🥉 Intermediate", "WR_Pct": 68.5, "Meteo": "15.0°C", "raw_watts": [260]*1000, "raw_hr": [165]*1000},
-                ]
+                # Storico sintetico riproducibile (dimensione regolabile per i test di carico)
+                st.session_state.data = load_demo_history(st.session_state.get("demo_runs", Config.DEMO_RUNS), Config.DEMO_SEED)
                 st.rerun()
 
 # --- 7. ATHLETE PARAMS ---
@@ -116,7 +160,6 @@ else:
 
     # SYNC ENGINE (PARALLEL)
     if do_sync and not st.session_state.demo_mode:
-        eng = ScoreEngine()
         aid = st.session_state.strava_token.get("athlete", {}).get("id", 0)
         tk = st.session_state.strava_token["access_token"]
         
@@ -127,64 +170,82 @@ else:
             if not act_list: 
                 status.update(label="Nessuna attività trovata.", state="error")
             else:
-                # Filtraggio esistenti
-                ex_ids = [r['id'] for r in st.session_state.data]
-                to_process = [s for s in act_list if s['id'] not in ex_ids]
+                # Nuove + modificate su Strava (impronta del riepilogo diversa da quella salvata)
+                known = {r['id']: r for r in db_svc.get_run_fingerprints(aid) or st.session_state.data}
+                new_acts, changed_acts = plan_sync(act_list, known)
+                changed_ids = {s['id'] for s in changed_acts}
+                to_process = new_acts + changed_acts
+                to_process.sort(key=lambda s: s['start_date_local']) # Cronologico: la baseline del digest include le nuove precedenti
+                # ETag validi solo per stream salvati allo stesso tier (il Laboratorio li porta a piena risoluzione)
+                etags = {i: known[i].get('Stream_ETag') for i in changed_ids
+                         if known[i].get('Stream_ETag') and known[i].get('Stream_Res') == (Config.STREAM_RESOLUTION_SYNC or "full")}
                 
                 if not to_process:
                     status.update(label="Tutte le attività sono già aggiornate!", state="complete")
                 else:
-                    st.write(f"⚙️ Elaborazione di {len(to_process)} nuove attività...")
+                    st.write(f"⚙️ Elaborazione di {len(new_acts)} nuove e {len(changed_acts)} modificate attività...")
                     p_bar = st.progress(0)
-                    new_cnt = 0
-                    
-                    # Funzione worker per processare singola attività
-                    def process_activity(s):
-                        try:
-                            streams = auth_svc.fetch_streams(tk, s['id'])
-                            if streams and 'watts' in streams and 'heartrate' in streams:
-                                dt = datetime.strptime(s['start_date_local'], "%Y-%m-%dT%H:%M:%SZ")
-                                lat_lng = s.get('start_latlng', [])
-                                
-                                # Meteo Reale
-                                t, h = 20.0, 50.0
-                                if lat_lng:
-                                    t, h = WeatherService.get_weather(lat_lng[0], lat_lng[1], dt.strftime("%Y-%m-%d"), dt.hour)
-                                
-                                m = RunMetrics(s.get('average_watts', 0), s.get('average_heartrate', 0), s.get('distance', 0), s.get('moving_time', 0), s.get('total_elevation_gain', 0), weight, hr_max, hr_rest, t, h)
-                                dec = eng.calculate_decoupling(streams['watts']['data'], streams['heartrate']['data'])
-                                
-                                score, details, wcf, wr_p = eng.compute_score(m, dec)
-                                rnk, _ = eng.get_rank(score)
-                                
-                                return {
-                                    "id": s['id'], "Data": dt.strftime("%Y-%m-%d"), 
-                                    "Dist (km)": round(m.distance_meters/1000, 2),
-                                    "Power": int(m.avg_power), "HR": int(m.avg_hr),
-                                    "Decoupling": round(dec*100, 1), "WCF": round(wcf, 2),
-                                    "SCORE": round(score, 2), "WR_Pct": round(wr_p, 1),
-                                    "Rank": rnk, "Meteo": f"{t}°C",
-                                    "SCORE_DETAIL": details,
-                                    "raw_watts": streams['watts']['data'], "raw_hr": streams['heartrate']['data']
-                                }
-                        except Exception as e:
-                            print(f"Error processing {s['id']}: {e}")
-                            return None
-                        return None
-
-                    # Parallel Execution
-                    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                        futures = {executor.submit(process_activity, s): s for s in to_process}
-                        
-                        for i, future in enumerate(concurrent.futures.as_completed(futures)):
-                            res = future.result()
-                            if res:
-                                db_svc.save_run(res, aid) # Save to DB synchronous (safer for SQLite/Supabase concurrent limits)
-                                new_cnt += 1
-                            p_bar.progress((i+1)/len(to_process))
                     
+                    # Pipeline a stadi: download (thread) -> analisi (processi) -> salvataggio a blocchi
+                    pipeline = SyncPipeline(auth_svc, tk, db_svc, aid, {
+                        "weight": weight, "hr_max": hr_max, "hr_rest": hr_rest, "ftp": ftp, "age": age,
+                        "resolution": Config.STREAM_RESOLUTION_SYNC # Tier ridotto: la piena risoluzione si scarica on-demand dal Laboratorio
+                    }, baseline=BaselineIndex(db_svc.get_run_summaries(aid)), etags=etags)
+                    new_runs = pipeline.run(to_process, on_progress=lambda i, n: p_bar.progress(i / n))
+                    if changed_ids: # Lo SCORE vecchio delle corse ricalcolate è nello sketch: indice ricostruito
+                        load_percentile_index.clear()
+                        pct_index = load_percentile_index()
+                    else:
+                        for res in new_runs: pct_index.add(res['SCORE'], age, res['Dist (km)'])
+                    new_cnt = len(new_runs)
+
+                    # Modello di carico: update O(1) per corsa (ordine cronologico), backfill vettoriale
+                    # se manca lo stato o arrivano corse precedenti all'ultimo aggiornamento
+                    # Inviluppo potenza: ogni curva nuova si fonde in O(durate)
+                    if new_runs:
+                        ath_state = db_svc.get_athlete_state(aid)
+                        tl = TrainingLoad.from_dict(ath_state.get("load"))
+                        new_runs.sort(key=lambda r: r['Data'])
+                        # Corse ricalcolate: il loro carico vecchio è già nello stato -> ricostruzione
+                        if not ath_state.get("load") or changed_ids or not all(tl.update(r['Data'], r['Load']) for r in new_runs):
+                            tl, _ = TrainingLoad.backfill(db_svc.get_run_summaries(aid), ftp)
+                        env = PowerCurveEnvelope.from_dict(ath_state.get("power_curve"))
+                        if env is None or changed_ids: # L'inviluppo tiene solo i massimi: un picco del file vecchio resterebbe
+                            env = PowerCurveEnvelope.build(db_svc.get_run_curves(aid))
+                        else:
+                            for r in new_runs: env.add(r['Data'], r['MMP']['watts'])
+                        ath_state.update({"load": tl.to_dict(), "power_curve": env.to_dict()})
+                        db_svc.save_athlete_state(aid, ath_state)
+                        st.session_state.training_load, st.session_state.power_envelope = tl, env
+
+                    # Indice corse simili: inserimento incrementale (corse ricalcolate -> ricostruito alla prossima apertura)
+                    if changed_ids:
+                        st.session_state.pop("run_index", None)
+                    elif "run_index" in st.session_state:
+                        for r in new_runs:
+                            st.session_state.run_index.add(r)
+                            st.session_state.run_rows[r['id']] = r
+
+                    # Risparmio del tier ridotto: Strava riporta la dimensione originale (1 Hz) di ogni stream
+                    tier_key = f"streams_{Config.STREAM_RESOLUTION_SYNC or 'full'}"
+                    kb_in = auth_svc.transfer_bytes.get(tier_key, 0) / 1024
+                    pts_kept = sum(len(r['raw_watts']) for r in new_runs)
+                    pts_full = sum(r['Stream_Size'] or len(r['raw_watts']) for r in new_runs)
+                    if pts_kept and pts_full > pts_kept:
+                        ratio = pts_full / pts_kept
+                        st.write(f"📉 Stream {Config.STREAM_RESOLUTION_SYNC}: {kb_in:.0f} KB scaricati (~{kb_in*(ratio-1):.0f} KB risparmiati), "
+                                 f"{pts_kept:,} punti salvati su {pts_full:,} (-{(1-1/ratio)*100:.0f}% storage)")
+
+                    unchanged = auth_svc.not_modified.get(tier_key, 0)
+                    if unchanged: st.write(f"🔁 {unchanged} stream invariati (304): rianalizzati dai dati salvati")
+
+                    saved = sum(v["coalesced"] for v in coalescing_stats().values())
+                    if saved: st.write(f"♻️ {saved} chiamate API evitate dall'avvio (richieste identiche condivise)")
+
+                    # Write-through fallito (rete, Supabase giù): ritentato a fine sync
+                    db_svc.push_pending()
                     st.session_state.data = db_svc.get_history()
-                    status.update(label=f"Completato! Aggiunte {new_cnt} attività.", state="complete")
+                    status.update(label=f"Completato! {new_cnt} attività elaborate ({len(changed_ids)} modificate).", state="complete")
                     if new_cnt: st.balloons(); time.sleep(1); st.rerun()
 
     # --- DASHBOARD INTELLIGENTE ---
@@ -228,9 +289,18 @@ else:
         elif delta_val < -0.005: trend_lbl, trend_col = "In Calo ↘", "inverse"
         else: trend_lbl, trend_col = "Stabile →", "off"
 
-        # Percentile Età
-        eng = ScoreEngine()
-        age_pct = eng.age_adjusted_percentile(cur_score, age)
+        # Fitness/Fatica/Forma: stato persistito (O(1) per sync), backfill solo alla prima apertura
+        if "training_load" not in st.session_state:
+            if st.session_state.demo_mode:
+                st.session_state.training_load, _ = TrainingLoad.backfill(st.session_state.data, ftp)
+                st.session_state.power_envelope = PowerCurveEnvelope.build(st.session_state.data)
+            else:
+                st.session_state.training_load, st.session_state.power_envelope = load_athlete_models(
+                    st.session_state.strava_token.get("athlete", {}).get("id", 0), ftp)
+        load_now = st.session_state.training_load.at()
+
+        # Percentile Età (empirico per fascia età / distanza, fallback statistico)
+        age_pct = pct_index.percentile(cur_score, age, cur_run['Dist (km)'])
 
         # TAB 1
         with t1:
@@ -262,6 +332,11 @@ else:
             with k3: st.metric("Benchmark", f"{cur_run['WR_Pct']}%", "vs WR")
             with k4: st.metric("Media 28gg", f"{round(cur_run['SCORE_MA_28'], 2)}", "Solidità")
             with k5: st.metric("Trend (7gg)", trend_lbl, f"{delta_val:+.3f}", delta_color=trend_col)
+
+            l1, l2, l3 = st.columns(3)
+            with l1: st.metric("Fitness (CTL)", load_now["CTL"], f"{Config.CTL_DAYS}gg")
+            with l2: st.metric("Fatica (ATL)", load_now["ATL"], f"{Config.ATL_DAYS}gg", delta_color="off")
+            with l3: st.metric("Forma (TSB)", load_now["TSB"], "Fresco" if load_now["TSB"] > 0 else "Affaticato", delta_color="normal" if load_now["TSB"] > 0 else "inverse")
             
             st.markdown("<br>", unsafe_allow_html=True)
 
@@ -291,13 +366,101 @@ else:
         with t2:
             st.markdown("### 🔬 Laboratorio Analisi")
             render_trend_chart(df.head(60)) # Mostriamo ultimi 60gg nel grafico
+
+            with st.expander("🎛️ Calibrazione SCORE (pesi e soglie)", expanded=False):
+                st.caption("Valuta migliaia di combinazioni di parametri su tutto lo storico salvato dell'atleta.")
+                if st.button("▶️ Esegui calibrazione"):
+                    t0 = time.perf_counter()
+                    # Solo le corse dell'atleta: peso e FC del profilo valgono per lui (digest = deriva finestra peggiore)
+                    history = st.session_state.data if st.session_state.demo_mode else (
+                        db_svc.get_run_digests(st.session_state.strava_token.get("athlete", {}).get("id", 0)) or st.session_state.data)
+                    report = CalibrationLab(history, weight, hr_max, hr_rest).evaluate(default_grid())
+                    st.write(f"{len(report)} set di parametri x {len(history)} corse in {time.perf_counter()-t0:.1f}s")
+                    st.dataframe(report.sort_values("spearman", ascending=False).head(50), use_container_width=True, hide_index=True)
             st.divider()
             
             # ... (sezione dettaglio singolo rimane uguale) ...
             opts = {r['id']: f"{r['Data'].strftime('%Y-%m-%d')} - {r['Dist (km)']}km" for i, r in df.iterrows()}
             sel = st.selectbox("Seleziona:", list(opts.keys()), format_func=lambda x: opts[x])
             run = df[df['id'] == sel].iloc[0].to_dict()
+
+            # Upgrade lazy a piena risoluzione quando la corsa viene aperta
+            if st.session_state.strava_token and run.get('Stream_Res', 'full') != 'full':
+                with st.spinner("Caricamento stream a piena risoluzione..."):
+                    full = auth_svc.fetch_streams(st.session_state.strava_token["access_token"], run['id'], resolution=Config.STREAM_RESOLUTION_FULL)
+                if full and 'watts' in full and 'heartrate' in full and len(full['watts']['data']) == len(full['heartrate']['data']):
+                    time_stream = full.get('time', {}).get('data')
+                    cl = clean_streams(full['watts']['data'], full['heartrate']['data'], time_stream, full.get('cadence', {}).get('data'))
+                    rs = resample_streams(cl['watts'], cl['hr'], time_stream,
+                                          run['Duration'] if pd.notna(run.get('Duration')) else None)
+                    run.update({
+                        "raw_watts": rs['watts'], "raw_hr": rs['hr'], "Duration": rs['duration'],
+                        "Stream_Res": "full", "Stream_Size": len(full['watts']['data']), "Stream_dt": rs['dt'],
+                        "Quality": cl['quality']
+                    })
+                    run["Drift_Curve"] = ScoreEngine().calculate_drift_curve(run['raw_watts'], run['raw_hr'], dt=rs['dt'])
+                    run["MMP"] = mean_max_power(run['raw_watts'], rs['dt'])
+                    run["Segments"] = detect_intervals(run['raw_watts'], run['raw_hr'], dt=rs['dt'])
+                    # Digest (zone, deriva, blocchi) coerente con gli stream a 1 Hz, baseline sullo storico dell'atleta
+                    aid = st.session_state.strava_token.get("athlete", {}).get("id", 0)
+                    run["Digest"] = build_digest(run, ftp, BaselineIndex(db_svc.get_run_summaries(aid)))
+                    db_svc.update_streams(run)
+                    for r in st.session_state.data:
+                        if r['id'] == run['id']: r.update({k: run[k] for k in ("raw_watts", "raw_hr", "Duration", "Stream_Res", "Stream_Size", "Stream_dt", "Quality", "Drift_Curve", "MMP", "Segments", "Digest")})
+
+                    # Le durate brevi diventano risolvibili solo a 1 Hz: aggiorniamo l'inviluppo
+                    ath_state = db_svc.get_athlete_state(aid)
+                    env = PowerCurveEnvelope.from_dict(ath_state.get("power_curve"))
+                    if env is not None:
+                        env.add(run['Data'], run['MMP']['watts'])
+                        ath_state["power_curve"] = env.to_dict()
+                        db_svc.save_athlete_state(aid, ath_state)
+                        st.session_state.power_envelope = env
             
+            # Demo: stream sintetici rigenerati dal seed della corsa
+            if st.session_state.demo_mode and not isinstance(run.get('raw_watts'), list):
+                run.update(synthetic_streams(run))
+
+            # Corse simili (KD-tree su feature normalizzate, costruito una volta per sessione)
+            if "run_index" not in st.session_state:
+                summaries = st.session_state.data if st.session_state.demo_mode else (
+                    db_svc.get_run_summaries(st.session_state.strava_token.get("athlete", {}).get("id", 0)) or st.session_state.data)
+                st.session_state.run_index = RunIndex(summaries, weight)
+                st.session_state.run_rows = {r['id']: r for r in summaries}
+            similar = st.session_state.run_index.query(run, k=Config.SIMILAR_K)
+            with st.expander(f"🔎 Corse simili ({len(similar)})", expanded=False):
+                if similar:
+                    rows = st.session_state.run_rows
+                    st.dataframe(pd.DataFrame([{
+                        "Data": str(rows[i]['Data'])[:10], "Dist (km)": rows[i]['Dist (km)'], "Power": rows[i]['Power'],
+                        "HR": rows[i]['HR'], "Decoupling": rows[i]['Decoupling'], "SCORE": rows[i]['SCORE'], "Distanza": d
+                    } for i, d in similar if i in rows]), use_container_width=True, hide_index=True)
+                else:
+                    st.info("Storico insufficiente per il confronto.")
+
+            # Blocchi lavoro/recupero (salvati in sync; calcolo al volo per le corse precedenti)
+            segments = run.get('Segments')
+            if not isinstance(segments, list):
+                segments = detect_intervals(run['raw_watts'], run['raw_hr'], dt=run.get('Stream_dt') or 1.0)
+
+            # Digest per il Coach AI (salvato in sync; ricalcolato se manca, è di una versione precedente o cambia la FTP)
+            digest = run.get('Digest')
+            if not is_current(digest, ftp):
+                run['Segments'] = segments
+                # Baseline sullo storico completo dell'atleta, come in sync (la sessione ha solo le ultime corse)
+                history = st.session_state.data if st.session_state.demo_mode else (
+                    db_svc.get_run_summaries(st.session_state.strava_token.get("athlete", {}).get("id", 0)) or st.session_state.data)
+                digest = run['Digest'] = build_digest(run, ftp, BaselineIndex(history))
+                if not st.session_state.demo_mode: db_svc.update_streams(run)
+                for r in st.session_state.data:
+                    if r['id'] == run['id']: r.update(Segments=segments, Digest=digest)
+
+            # Qualità dati (pulizia in ingest): picchi e buchi già corretti negli stream mostrati
+            q = run.get('Quality')
+            if isinstance(q, dict):
+                st.caption(f"Qualità dati: {q['score']:.0%} · picchi potenza {q['spikes_w']} · buchi potenza {q['dropouts_w']} · "
+                           f"buchi FC {q['dropouts_hr']} · FC piatta {q['flatline_hr']} · FC su cadenza {q.get('cadence_lock_hr', 0)} campioni")
+
             c_ai, c_ch = st.columns([1, 2])
             with c_ai:
                 st.markdown("##### � Analisi Corsa")
@@ -306,8 +469,18 @@ else:
                 else:
                     if st.button("✨ Genera Analisi"):
                         coach = AICoachService(gemini_key)
-                        res = coach.get_feedback(run, ScoreEngine().calculate_zones(run['raw_watts'], ftp))
+                        res = coach.get_feedback(run, digest)
                         st.write(res); db_svc.update_ai_feedback(run['id'], res)
             with c_ch:
                 render_scatter_chart(run['raw_watts'], run['raw_hr'])
-                render_zones_chart(ScoreEngine().calculate_zones(run['raw_watts'], ftp))
+                render_segments_chart(run['raw_watts'], segments, run.get('Stream_dt') or 1.0)
+                drift_curve = run.get('Drift_Curve')
+                if not isinstance(drift_curve, dict):
+                    drift_curve = get_drift_curve(run['id'], run['raw_watts'], run['raw_hr'], run.get('Stream_dt') or 1.0)
+                render_drift_chart(drift_curve)
+
+                run_mmp = run.get('MMP')
+                if not isinstance(run_mmp, dict):
+                    run_mmp = mean_max_power(run['raw_watts'], run.get('Stream_dt') or 1.0)
+                render_power_curve_chart(Config.MMP_DURATIONS_SEC, run_mmp, st.session_state.power_envelope.curves())
+                render_zones_chart(digest['zones'])
@@ -0,0 +1,64 @@
+"""
+Test di carico headless della Dashboard e del Laboratorio sullo storico sintetico della modalità Demo.
+Per ogni N: tempo di render (primo accesso, rerun, apertura di una corsa in Laboratorio)
+e dimensione del payload inviato al browser (elementi Streamlit serializzati) per tab.
+
+Uso: python -m benchmarks.dashboard_load [--runs 100 1000 10000]
+"""
+import argparse
+import os
+import time
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+SECRETS = {
+    "strava": {"client_id": "bench", "client_secret": "bench"},
+    "gemini": {"api_key": "bench"},
+    "storage": {"backend": "sqlite", "path": ":memory:"}, # Nessun servizio remoto
+}
+
+def _payload_bytes(node):
+    """Byte dei proto di tutti gli elementi sotto 'node' (quello che Streamlit serializza verso il browser)."""
+    proto = getattr(node, "proto", None)
+    if proto is not None and not hasattr(node, "children"):
+        return proto.ByteSize()
+    return sum(_payload_bytes(c) for c in getattr(node, "children", {}).values())
+
+def _timed_run(at, timeout):
+    t0 = time.perf_counter()
+    at.run(timeout=timeout)
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    return time.perf_counter() - t0
+
+def measure(n_runs, timeout=600):
+    at = AppTest.from_file(APP, default_timeout=timeout)
+    for k, v in SECRETS.items(): at.secrets[k] = v
+    at.session_state["demo_runs"] = n_runs
+    at.run()
+
+    next(b for b in at.button if b.label == "👀 Demo").click()
+    t_first = _timed_run(at, timeout) # click + generazione storico + primo render (st.rerun incluso)
+    t_rerun = _timed_run(at, timeout) # storico e modelli già in cache/sessione
+
+    # Apertura della corsa meno recente del periodo: stream rigenerati, deriva, segmenti, grafici
+    sel = at.selectbox[1]
+    sel.select_index(len(sel.options) - 1)
+    t_lab = _timed_run(at, timeout)
+
+    dash, lab = at.tabs[0], at.tabs[1]
+    return {
+        "runs": n_runs, "first_s": t_first, "rerun_s": t_rerun, "lab_open_s": t_lab,
+        "dashboard_kb": _payload_bytes(dash) / 1024, "lab_kb": _payload_bytes(lab) / 1024,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test di carico della Dashboard (modalità Demo)")
+    parser.add_argument("--runs", type=int, nargs="+", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    print(f"{'corse':>7} {'primo(s)':>9} {'rerun(s)':>9} {'lab(s)':>8} {'dash KB':>9} {'lab KB':>8}")
+    for n in args.runs:
+        r = measure(n)
+        print(f"{r['runs']:>7} {r['first_s']:>9.2f} {r['rerun_s']:>9.2f} {r['lab_open_s']:>8.2f} {r['dashboard_kb']:>9.1f} {r['lab_kb']:>8.1f}")
@@ -1,3 +1,4 @@
+import os
 import streamlit as st
 
 class Config:
@@ -17,6 +18,28 @@ class Config:
     # Penalties
     DECOUPLING_THRESHOLD = 0.05 # 5% drift is normal
     DECOUPLING_PENALTY_FACTOR = 2.0
+
+    # Stream Tiers (Strava resolution: None = piena 1 Hz, 'low' ~100, 'medium' ~1000, 'high' ~10000 punti)
+    STREAM_RESOLUTION_SYNC = "medium" # Tier salvato di default in sync (riepiloghi, scatter, decoupling)
+    STREAM_RESOLUTION_FULL = None     # Tier caricato on-demand (Laboratorio, analisi dettagliate)
+    STREAM_MAX_GAP_SEC = 15           # Buco tra campioni oltre il quale è una pausa (tempo fermo rimosso, non interpolato)
+
+    # Pulizia stream in ingest (picchi potenza, perdite segnale, fascia FC)
+    CLEAN_MEDIAN_SEC = 5          # Finestra della mediana mobile per i picchi di potenza
+    CLEAN_SPIKE_ABS_W = 100       # Picco: almeno +100 W sopra la mediana...
+    CLEAN_SPIKE_REL = 0.5         # ...e almeno +50% della mediana
+    CLEAN_MAX_WATTS = 1500        # Oltre questo valore il campione è sempre un artefatto (corsa)
+    CLEAN_MAX_DROPOUT_SEC = 10    # Zeri di potenza più brevi = segnale perso (interpolati), più lunghi = sosta vera
+    CLEAN_HR_RANGE = (30, 230)    # FC fuori range = fascia che perde contatto
+    CLEAN_FLATLINE_SEC = 30       # FC identica più a lungo = sensore bloccato (solo segnalato)...
+    CLEAN_FLATLINE_MIN_SAMPLES = 30 # ...e per almeno tanti campioni (sui tier ridotti pochi campioni coprono già 30 s)
+    CLEAN_CADENCE_LOCK_BPM = 2    # FC entro ±2 bpm dalla cadenza (passi/min o passi/min x2) = ottico agganciato alla cadenza...
+    CLEAN_CADENCE_LOCK_SEC = 60   # ...per almeno 60 s di fila (più breve può essere una coincidenza): FC interpolata
+
+    # Drift Curve (finestre scorrevoli Potenza/FC)
+    DRIFT_WINDOW_SEC = 600                # Finestra 10 minuti
+    DRIFT_STEP_SEC = 60                   # Passo 1 minuto
+    DRIFT_PENALTY_USE_WORST_WINDOW = False # Se True il malus usa max(decoupling, deriva finestra peggiore)
     
     # Volume Scaling
     VOLUME_LOG_DIVISOR = 4.5
@@ -28,7 +51,57 @@ class Config:
         "ADVANCED": 0.22,
         "INTERMEDIATE": 0.15
     }
-    
+
+    # Percentile Index (empirico, per fascia età / classe distanza)
+    PERCENTILE_AGE_BANDS = [30, 40, 50]          # <30, 30-39, 40-49, 50+
+    PERCENTILE_DISTANCE_CLASSES_KM = [8, 16, 30] # Corto, Medio, Lungo, Ultra
+    PERCENTILE_MIN_SAMPLES = 30                  # Sotto questa soglia -> formula statistica
+    PERCENTILE_SKETCH_SIZE = 200                 # Centroidi massimi per bucket
+
+    # Training Load (Fitness/Fatica/Forma)
+    CTL_DAYS = 42 # Costante di tempo Fitness (Chronic Training Load)
+    ATL_DAYS = 7  # Costante di tempo Fatica (Acute Training Load)
+
+    # Power Curve (Mean-Maximal Power)
+    MMP_DURATIONS_SEC = [1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 300, 420, 600,
+                         900, 1200, 1800, 2700, 3600, 5400, 7200, 10800, 14400]
+    MMP_ROLLING_DAYS = 90
+
+    # Interval Detection (segmentazione lavoro/recupero)
+    INTERVAL_BIN_SEC = 5          # Risoluzione della segmentazione
+    INTERVAL_MIN_SEC = 30         # Durata minima di un blocco
+    INTERVAL_PENALTY = 4.0        # Penalità per nuovo taglio (x rumore^2 x log n): più alta = meno blocchi
+    INTERVAL_MAX_SEGMENTS = 80
+    INTERVAL_MIN_CONTRAST = 0.2   # Differenza relativa minima lavoro/recupero, altrimenti corsa continua
+
+    # Similar Runs (KD-tree sulle feature normalizzate)
+    SIMILAR_K = 5
+    SIMILAR_MIN_BUFFER = 32      # Corse aggiunte in sync prima di valutare un rebuild
+    SIMILAR_REBUILD_RATIO = 0.1  # Rebuild quando il buffer supera il 10% dell'albero (query sotto il ms)
+
+    # Sync Pipeline (stadi con code limitate: fetch I/O -> analisi CPU -> scrittura a blocchi)
+    SYNC_FETCH_WORKERS = 5                           # Thread di download stream + meteo
+    SYNC_CPU_WORKERS = min(4, (os.cpu_count() or 1) - 1) # Processi di analisi fuori dal GIL (0 = inline, es. host a 1 core)
+    SYNC_PROCESS_MIN_RUNS = 50                       # Sotto questa soglia analisi inline (pochi ms per corsa)
+    SYNC_QUEUE_SIZE = 16                             # Attività in attesa tra uno stadio e il successivo
+    SYNC_WRITE_BATCH = 25                            # Corse per upsert
+    # Campi del riepilogo Strava che entrano nell'analisi: se cambia l'impronta la corsa si riscarica e si ricalcola
+    SYNC_FINGERPRINT_FIELDS = ("type", "sport_type", "start_date_local", "distance", "moving_time", "elapsed_time",
+                               "total_elevation_gain", "average_watts", "device_watts", "average_heartrate",
+                               "has_heartrate", "start_latlng", "upload_id", "external_id")
+
+    # Run Digest (contesto compatto per il Coach AI e le analisi batch)
+    DIGEST_BASELINE_DAYS = 28 # Finestra di confronto con le corse precedenti
+    DIGEST_MAX_BLOCKS = 20    # Blocchi lavoro/recupero riportati nel prompt
+
+    # Report batch (settimanali/mensili)
+    REPORT_DRIFT_Z = 3.0        # Deriva anomala: z-score robusto rispetto allo storico dell'atleta
+    REPORT_DRIFT_MIN_MAD = 1.0  # Dispersione minima (punti %) per atleti con derive molto regolari
+    REPORT_MMP_DURATIONS_SEC = [60, 300, 1200, 3600] # Best efforts del periodo (durate della curva MMP)
+
+    # Calibration Lab
+    CALIBRATION_CHUNK_CELLS = 5_000_000 # Celle (parametri x corse) per blocco NumPy (~40MB float64)
+
     # --- DEFAULTS ---
     DEFAULT_WEIGHT = 70.0
     DEFAULT_HR_MAX = 185
@@ -36,6 +109,17 @@ class Config:
     DEFAULT_FTP = 250
     DEFAULT_AGE = 30
     
+    # --- DEMO ---
+    DEMO_RUNS = 500 # Corse dello storico sintetico (fino a 10k per i test di carico)
+    DEMO_SEED = 42
+
+    # --- STORAGE ---
+    LOCAL_DB_PATH = "data/score.db" # SQLite locale (backend 'sqlite' o 'sqlite+supabase')
+
+    # Archivio Parquet (export/import massivi)
+    ARCHIVE_BATCH_ROWS = 2000     # Righe per blocco in lettura/scrittura (limita la memoria)
+    ARCHIVE_MAX_OPEN_FILES = 256  # Partizioni athlete/mese aperte contemporaneamente in scrittura
+
     # --- SECRETS & KEYS ---
     @staticmethod
     def check_secrets():
@@ -49,9 +133,10 @@ class Config:
         if not st.secrets.get("strava", {}).get("client_id"): missing.append("strava.client_id")
         if not st.secrets.get("strava", {}).get("client_secret"): missing.append("strava.client_secret")
         
-        # Supabase
-        if not st.secrets.get("supabase", {}).get("url"): missing.append("supabase.url")
-        if not st.secrets.get("supabase", {}).get("key"): missing.append("supabase.key")
+        # Supabase (non serve con lo storage solo locale)
+        if Config.get_storage_settings().get("backend", "supabase") != "sqlite":
+            if not st.secrets.get("supabase", {}).get("url"): missing.append("supabase.url")
+            if not st.secrets.get("supabase", {}).get("key"): missing.append("supabase.key")
         
         # Gemini (Optional but recommended)
         if not st.secrets.get("gemini", {}).get("api_key"): missing.append("gemini.api_key")
@@ -66,6 +151,10 @@ class Config:
     def get_supabase_creds():
         return st.secrets.get("supabase", {})
 
+    @staticmethod
+    def get_storage_settings():
+        return st.secrets.get("storage", {})
+
     @staticmethod
     def get_gemini_key():
         return st.secrets.get("gemini", {}).get("api_key")
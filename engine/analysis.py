@@ -0,0 +1,63 @@
+from datetime import datetime
+from engine.core import ScoreEngine, RunMetrics
+from engine.load import run_load
+from engine.power_curve import mean_max_power
+from engine.intervals import detect_intervals
+from engine.streams import resample_streams
+from engine.cleaning import clean_streams
+from engine.digest import build_digest
+
+def analyze_activity(s, streams, weather, params):
+    """
+    Analisi completa di una corsa (solo CPU, nessuna rete): decoupling, deriva, SCORE, carico, MMP, segmenti.
+    Funzione top-level e input serializzabili: gira anche in un processo separato del pool di sync.
+    s: riepilogo attività Strava, streams: stream key_by_type, weather: (temperatura, umidità),
+    params: parametri atleta (weight, hr_max, hr_rest, ftp, age) e tier dello stream (resolution).
+    """
+    if not streams or 'watts' not in streams or 'heartrate' not in streams: return None
+    n_pts = len(streams['watts']['data'])
+    if not n_pts or len(streams['heartrate']['data']) != n_pts:
+        print(f"Stream incoerenti per {s['id']}: {n_pts} potenza / {len(streams['heartrate']['data'])} FC, corsa saltata")
+        return None
+    eng = ScoreEngine()
+    time_stream = streams.get('time', {}).get('data')
+    cadence = streams.get('cadence', {}).get('data') # Opzionale (niente sensore/stream salvati): aggancio non controllato
+    # Pulizia (picchi, perdite segnale) sui campioni originali, poi griglia a passo fisso (pause rimosse):
+    # da qui ogni campione vale stream_dt secondi
+    cleaned = streams.get('cleaned') # Stream salvati (risposta 304): già puliti, resta la qualità originale
+    cl = ({"watts": streams['watts']['data'], "hr": streams['heartrate']['data'], "quality": cleaned.get('quality')} if cleaned
+          else clean_streams(streams['watts']['data'], streams['heartrate']['data'], time_stream, cadence))
+    rs = resample_streams(cl['watts'], cl['hr'], time_stream, s.get('moving_time'))
+    watts, hr, stream_dt, duration = rs['watts'], rs['hr'], rs['dt'], rs['duration']
+    dt = datetime.strptime(s['start_date_local'], "%Y-%m-%dT%H:%M:%SZ")
+    t, h = weather
+
+    m = RunMetrics(s.get('average_watts', 0), s.get('average_heartrate', 0), s.get('distance', 0), s.get('moving_time', 0), s.get('total_elevation_gain', 0),
+                   params['weight'], params['hr_max'], params['hr_rest'], t, h)
+    dec = eng.calculate_decoupling(watts, hr)
+    drift = eng.calculate_drift_curve(watts, hr, dt=stream_dt)
+
+    load = run_load(watts, params['ftp'], duration, dt=stream_dt)
+    mmp = mean_max_power(watts, dt=stream_dt)
+    segments = detect_intervals(watts, hr, dt=stream_dt)
+
+    score, details, wcf, wr_p = eng.compute_score(m, dec, drift['worst'])
+    rnk, _ = eng.get_rank(score)
+
+    res = {
+        "id": s['id'], "Data": dt.strftime("%Y-%m-%d"),
+        "Dist (km)": round(m.distance_meters/1000, 2),
+        "Power": int(m.avg_power), "HR": int(m.avg_hr),
+        "Decoupling": round(dec*100, 1), "WCF": round(wcf, 2),
+        "SCORE": round(score, 2), "WR_Pct": round(wr_p, 1),
+        "Rank": rnk, "Meteo": f"{t}°C", "Age": params['age'],
+        "SCORE_DETAIL": details, "Drift_Curve": drift,
+        "Duration": duration, "Load": load, "MMP": mmp, "Segments": segments,
+        "Stream_Res": params.get('resolution') or "full",
+        "Stream_Size": streams['watts'].get('original_size', n_pts), "Stream_dt": stream_dt,
+        "Quality": cl['quality'],
+        "raw_watts": watts, "raw_hr": hr
+    }
+    # Digest per il Coach AI (la baseline sulle corse precedenti si aggiunge in scrittura, dove c'è lo storico)
+    res["Digest"] = build_digest(res, params['ftp'])
+    return res
@@ -0,0 +1,141 @@
+import itertools
+import numpy as np
+import pandas as pd
+from config import Config
+
+# Parametri calibrabili e valore attuale in Config
+PARAM_KEYS = ["WEIGHT_POWER", "WEIGHT_VOLUME", "WEIGHT_INTENSITY", "DECOUPLING_THRESHOLD",
+              "DECOUPLING_PENALTY_FACTOR", "VOLUME_LOG_DIVISOR", "WR_WKG",
+              "ELITE", "PRO", "ADVANCED", "INTERMEDIATE"]
+RANK_LABELS = ["Elite", "Pro", "Advanced", "Intermediate", "Amateur"]
+
+def current_params():
+    """Set di parametri attualmente in uso (baseline)."""
+    base = {k: getattr(Config, k) for k in PARAM_KEYS[:7]}
+    base.update(Config.RANK_THRESHOLDS)
+    return base
+
+def make_grid(**axes):
+    """
+    Prodotto cartesiano degli assi indicati (gli altri restano ai valori di Config).
+    WEIGHT_INTENSITY, se non specificato, è il complemento a 1 dei pesi potenza/volume.
+    """
+    base = current_params()
+    names = list(axes.keys())
+    combos = np.array(list(itertools.product(*[np.atleast_1d(axes[n]) for n in names])), dtype=float)
+
+    grid = {k: np.full(len(combos), v, dtype=float) for k, v in base.items()}
+    for j, n in enumerate(names):
+        grid[n] = combos[:, j]
+    if "WEIGHT_INTENSITY" not in axes:
+        grid["WEIGHT_INTENSITY"] = 1.0 - grid["WEIGHT_POWER"] - grid["WEIGHT_VOLUME"]
+
+    valid = grid["WEIGHT_INTENSITY"] >= 0 # Pesi negativi non hanno senso
+    return {k: v[valid] for k, v in grid.items()}
+
+def default_grid():
+    """Griglia di esplorazione attorno ai valori attuali (~10k set di parametri)."""
+    return make_grid(
+        WEIGHT_POWER=np.linspace(0.3, 0.7, 9),
+        WEIGHT_VOLUME=np.linspace(0.1, 0.5, 9),
+        DECOUPLING_THRESHOLD=np.linspace(0.03, 0.08, 6),
+        DECOUPLING_PENALTY_FACTOR=np.linspace(1.0, 3.0, 5),
+        VOLUME_LOG_DIVISOR=np.linspace(3.5, 5.5, 5),
+    )
+
+class CalibrationLab:
+    """
+    Valuta migliaia di set di parametri SCORE sullo storico in un'unica passata NumPy:
+    matrice (parametri x corse) calcolata per broadcasting, a blocchi per limitare la memoria.
+    history: corse di un solo atleta (peso e FC del profilo valgono per tutte); con 'Digest' la deriva
+    della finestra peggiore entra nel malus se Config.DRIFT_PENALTY_USE_WORST_WINDOW, come in compute_score.
+    """
+    def __init__(self, history, weight=None, hr_max=None, hr_rest=None):
+        df = pd.DataFrame(history).dropna(subset=["Power", "HR", "Dist (km)"])
+        if "Data" in df.columns:
+            df = df.sort_values("Data")
+
+        weight = weight or Config.DEFAULT_WEIGHT
+        hr_max = hr_max or Config.DEFAULT_HR_MAX
+        hr_rest = hr_rest or Config.DEFAULT_HR_REST
+
+        # Feature per corsa, indipendenti dai parametri (stesse formule di ScoreEngine.compute_score)
+        self.w_kg = df["Power"].to_numpy(float) / weight
+        self.log_dist = np.log(df["Dist (km)"].to_numpy(float) + 1)
+        if hr_max - hr_rest > 0:
+            self.hr_res = (df["HR"].to_numpy(float) - hr_rest) / (hr_max - hr_rest)
+        else:
+            self.hr_res = np.full(len(df), 0.7)
+        self.dec = df["Decoupling"].fillna(0).to_numpy(float) / 100
+        if Config.DRIFT_PENALTY_USE_WORST_WINDOW and "Digest" in df.columns:
+            worst = [((d.get("drift") or {}) if isinstance(d, dict) else {}).get("worst_pct") for d in df["Digest"]]
+            self.dec = np.fmax(self.dec, np.array(worst, dtype=float) / 100) # Senza digest: solo decoupling
+        self.n_runs = len(df)
+
+    def scores(self, grid):
+        """Matrice SCORE (n_param x n_corse)."""
+        col = lambda k: np.asarray(grid[k], dtype=float)[:, None]
+        wcf = np.minimum(self.w_kg[None, :] / col("WR_WKG"), 1.0)
+        vol = self.log_dist[None, :] / col("VOLUME_LOG_DIVISOR")
+        pen = np.maximum(0, self.dec[None, :] - col("DECOUPLING_THRESHOLD")) * col("DECOUPLING_PENALTY_FACTOR")
+        raw = wcf * col("WEIGHT_POWER") + vol * col("WEIGHT_VOLUME") + self.hr_res[None, :] * col("WEIGHT_INTENSITY") - pen
+        return np.maximum(0.01, np.round(raw, 2))
+
+    def _rank_codes(self, scores, grid):
+        # 0=Elite ... 4=Amateur, stessa logica (soglie strette) di ScoreEngine.get_rank
+        codes = np.full(scores.shape, 4, dtype=np.int8)
+        for code, key in reversed(list(enumerate(["ELITE", "PRO", "ADVANCED", "INTERMEDIATE"]))):
+            codes[scores > np.asarray(grid[key], dtype=float)[:, None]] = code
+        return codes
+
+    def evaluate(self, grid=None, chunk_cells=None):
+        """
+        Report per set di parametri: distribuzione SCORE, mix dei rank e stabilità
+        rispetto alla configurazione attuale (correlazione di Spearman e quota di rank cambiati).
+        """
+        grid = grid if grid is not None else default_grid()
+        chunk_cells = chunk_cells or Config.CALIBRATION_CHUNK_CELLS
+        n_params = len(grid["WEIGHT_POWER"])
+        report = pd.DataFrame({k: np.asarray(v, dtype=float) for k, v in grid.items()})
+        if self.n_runs == 0 or n_params == 0:
+            return report
+
+        base = {k: np.array([v], dtype=float) for k, v in current_params().items()}
+        base_scores = self.scores(base)
+        base_codes = self._rank_codes(base_scores, base)[0]
+        base_ranks = self._ranks(base_scores)[0]
+
+        metrics = {m: np.empty(n_params) for m in ["mean", "std", "p10", "p50", "p90", "spearman", "rank_changed"]}
+        for lbl in RANK_LABELS: metrics[f"pct_{lbl}"] = np.empty(n_params)
+
+        step = max(1, chunk_cells // self.n_runs)
+        for lo in range(0, n_params, step):
+            sl = slice(lo, min(lo + step, n_params))
+            sub = {k: np.asarray(v)[sl] for k, v in grid.items()}
+            sc = self.scores(sub)
+            codes = self._rank_codes(sc, sub)
+
+            metrics["mean"][sl] = sc.mean(axis=1)
+            metrics["std"][sl] = sc.std(axis=1)
+            metrics["p10"][sl], metrics["p50"][sl], metrics["p90"][sl] = np.percentile(sc, [10, 50, 90], axis=1)
+            for code, lbl in enumerate(RANK_LABELS):
+                metrics[f"pct_{lbl}"][sl] = (codes == code).mean(axis=1) * 100
+
+            # Stabilità: l'ordinamento delle corse resta coerente con quello attuale?
+            ranks = self._ranks(sc)
+            rc, bc = ranks - ranks.mean(axis=1, keepdims=True), base_ranks - base_ranks.mean()
+            denom = np.sqrt((rc**2).sum(axis=1) * (bc**2).sum())
+            metrics["spearman"][sl] = np.divide((rc * bc).sum(axis=1), denom, out=np.ones(len(rc)), where=denom > 0)
+            metrics["rank_changed"][sl] = (codes != base_codes).mean(axis=1) * 100
+
+        for k, v in metrics.items():
+            report[k] = np.round(v, 4)
+        return report
+
+    @staticmethod
+    def _ranks(scores):
+        # Ranghi (0..n-1) lungo le corse, per la correlazione di Spearman
+        order = scores.argsort(axis=1, kind="stable")
+        ranks = np.empty(scores.shape)
+        np.put_along_axis(ranks, order, np.arange(scores.shape[1], dtype=float)[None, :], axis=1)
+        return ranks
@@ -0,0 +1,95 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from config import Config
+
+def _runs(mask):
+    """Inizio/fine (esclusa) dei tratti True consecutivi, vettoriale."""
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.flatnonzero(d == 1), np.flatnonzero(d == -1)
+
+def _rolling_median(x, w):
+    half = w // 2
+    return np.median(sliding_window_view(np.pad(x, half, mode="edge"), w), axis=1)
+
+def _fill(x, bad, t):
+    """Interpolazione lineare sul tempo dei campioni scartati (ai bordi: valore valido più vicino)."""
+    good = ~bad
+    if bad.any() and good.any():
+        x = x.copy()
+        x[bad] = np.interp(t[bad], t[good], x[good])
+    return x
+
+def clean_streams(watts_stream, hr_stream, time_stream=None, cadence_stream=None):
+    """
+    Pulizia degli stream in ingest, prima di ricampionamento e analisi. Tutto vettoriale, costo lineare:
+    - Potenza: picchi oltre la mediana mobile (Config.CLEAN_MEDIAN_SEC) o sopra Config.CLEAN_MAX_WATTS
+      -> valore della mediana; zeri brevi in corsa (perdita segnale) -> interpolati.
+    - FC: zeri / fuori range (fascia che perde contatto) -> interpolati sul tempo.
+    - FC agganciata alla cadenza (ottico che legge il passo, Config.CLEAN_CADENCE_LOCK_*) -> interpolata; serve lo stream cadence.
+    - FC piatta a lungo mentre attorno varia (sensore bloccato) -> solo segnalata; FC stabile ovunque non è un errore.
+    Ritorna gli stream puliti e 'quality': conteggi per tipo e punteggio 0-1 (quota di campioni intatti).
+    """
+    p = np.asarray(watts_stream, dtype=float)
+    h = np.asarray(hr_stream, dtype=float)
+    n = len(p)
+    if n == 0 or len(h) != n:
+        return {"watts": p, "hr": h, "quality": None}
+
+    t = np.asarray(time_stream, dtype=float) if time_stream is not None and len(time_stream) == n else np.arange(n, dtype=float)
+    step = max(1.0, float(np.median(np.diff(t)))) if n > 1 else 1.0
+    p[~np.isfinite(p)] = 0.0 # Campioni mancanti (null) = segnale perso
+
+    # 1. Picchi di potenza: solo verso l'alto e con scarto sia assoluto che relativo
+    w = max(3, int(round(Config.CLEAN_MEDIAN_SEC / step)) | 1)
+    med = _rolling_median(p, w) if n >= w else np.full(n, np.median(p))
+    spikes = ((p - med > np.maximum(Config.CLEAN_SPIKE_ABS_W, Config.CLEAN_SPIKE_REL * med)) & (p > 0)) | (p > Config.CLEAN_MAX_WATTS)
+    p = np.where(spikes, med, p)
+
+    # 2. Buchi di potenza: tratti di zeri brevi tra due campioni validi (le soste vere sono più lunghe)
+    starts, ends = _runs(p <= 0)
+    short = ((ends - starts) * step <= Config.CLEAN_MAX_DROPOUT_SEC) & (starts > 0) & (ends < n)
+    marks = np.zeros(n + 1, dtype=int) # +1/-1 ai bordi dei tratti, somma cumulata = dentro un tratto
+    np.add.at(marks, starts[short], 1)
+    np.add.at(marks, ends[short], -1)
+    drop_w = np.cumsum(marks[:n]) > 0
+    p = _fill(p, drop_w, t)
+
+    # 3. FC: valori impossibili = fascia staccata
+    lo, hi = Config.CLEAN_HR_RANGE
+    drop_hr = ~np.isfinite(h) | (h < lo) | (h > hi)
+    h = _fill(np.where(drop_hr, 0.0, h), drop_hr, t) if not drop_hr.all() else h
+
+    # 4. Aggancio alla cadenza: FC che coincide con la cadenza (Strava: passi/min per gamba, x1 o x2) per un tratto lungo
+    drop_lock = np.zeros(n, dtype=bool)
+    c = np.asarray(cadence_stream, dtype=float) if cadence_stream is not None and len(cadence_stream) == n else None
+    if c is not None:
+        tol = Config.CLEAN_CADENCE_LOCK_BPM
+        lock = (c > 0) & ((np.abs(h - c) <= tol) | (np.abs(h - 2 * c) <= tol))
+        starts, ends = _runs(lock)
+        long = (ends - starts) * step >= Config.CLEAN_CADENCE_LOCK_SEC
+        marks = np.zeros(n + 1, dtype=int)
+        np.add.at(marks, starts[long], 1)
+        np.add.at(marks, ends[long], -1)
+        drop_lock = np.cumsum(marks[:n]) > 0
+        h = _fill(h, drop_lock, t) if not drop_lock.all() else h
+
+    # 5. FC piatta: tratti identici lunghi (in secondi e in campioni) con segnale che varia subito prima o dopo
+    moves = np.diff(h) != 0
+    starts, ends = _runs(np.concatenate(([False], ~moves)))
+    starts -= 1 # Il tratto include il primo valore ripetuto
+    lengths = ends - starts
+    min_len = max(Config.CLEAN_FLATLINE_MIN_SAMPLES, int(np.ceil(Config.CLEAN_FLATLINE_SEC / step)))
+    chg = np.concatenate(([0], np.cumsum(moves))) # chg[i] = variazioni tra i campioni 0..i
+    before = chg[starts] - chg[np.maximum(starts - lengths, 0)]
+    after = chg[np.minimum(ends - 1 + lengths, n - 1)] - chg[ends - 1]
+    flat = int(lengths[(lengths >= min_len) & ((before > 0) | (after > 0))].sum())
+
+    bad = int(spikes.sum() + drop_w.sum() + drop_hr.sum() + drop_lock.sum()) + flat
+    return {
+        "watts": p, "hr": h,
+        "quality": {
+            "score": round(max(0.0, 1 - bad / (2 * n)), 3),
+            "spikes_w": int(spikes.sum()), "dropouts_w": int(drop_w.sum()),
+            "dropouts_hr": int(drop_hr.sum()), "flatline_hr": flat, "cadence_lock_hr": int(drop_lock.sum()),
+        },
+    }
@@ -1,4 +1,5 @@
 import math
+import numpy as np
 from config import Config
 
 class RunMetrics:
@@ -55,6 +56,44 @@ class ScoreEngine:
         if ratio1 == 0: return 0.0
         return (ratio1 - ratio2) / ratio1
 
+    def calculate_drift_curve(self, power_stream, hr_stream, window_sec=None, step_sec=None, dt=1.0):
+        """
+        Curva di deriva aerobica: efficienza Potenza/FC su finestre scorrevoli lungo tutta la corsa.
+        Somme cumulative -> O(n). La deriva di ogni finestra è relativa all'efficienza della prima metà
+        (stessa convenzione di calculate_decoupling: positivo = perdita di efficienza).
+        """
+        empty = {"t_min": [], "drift": [], "worst": 0.0}
+        if not power_stream or not hr_stream or len(power_stream) != len(hr_stream):
+            return empty
+
+        p = np.asarray(power_stream, dtype=float)
+        h = np.asarray(hr_stream, dtype=float)
+        w = max(1, int(round((window_sec or Config.DRIFT_WINDOW_SEC) / dt)))
+        step = max(1, int(round((step_sec or Config.DRIFT_STEP_SEC) / dt)))
+        n = len(p)
+        if n < w: return empty
+
+        mid = n // 2
+        base_h = h[:mid].sum()
+        if mid == 0 or base_h <= 0: return empty
+        base_ef = p[:mid].sum() / base_h
+        if base_ef <= 0: return empty
+
+        cs_p = np.concatenate(([0.0], np.cumsum(p)))
+        cs_h = np.concatenate(([0.0], np.cumsum(h)))
+        starts = np.arange(0, n - w + 1, step)
+        sum_p = cs_p[starts + w] - cs_p[starts]
+        sum_h = cs_h[starts + w] - cs_h[starts]
+
+        ef = np.divide(sum_p, sum_h, out=np.full(len(starts), base_ef), where=sum_h > 0)
+        drift = (base_ef - ef) / base_ef
+
+        return {
+            "t_min": np.round((starts + w) * dt / 60, 1).tolist(), # Fine finestra (minuti)
+            "drift": np.round(drift, 4).tolist(),
+            "worst": round(float(drift.max()), 4)
+        }
+
     def age_adjusted_percentile(self, score, age):
         """Calcola il percentile basato sull'età (Mock statistico)"""
         # Semplificazione statistica: i punteggi calano con l'età.
@@ -72,7 +111,7 @@ class ScoreEngine:
         pct = 50 + (z * 34)
         return max(1.0, min(99.9, round(pct, 1)))
 
-    def compute_score(self, m: RunMetrics, decoupling):
+    def compute_score(self, m: RunMetrics, decoupling, worst_drift=None):
         # 1. World Class Factor (Benchmark Power/Weight)
         w_kg = m.avg_power / m.weight
         wcf = min(w_kg / Config.WR_WKG, 1.0)
@@ -82,6 +121,9 @@ class ScoreEngine:
         vol_factor = math.log(dist_km + 1) / Config.VOLUME_LOG_DIVISOR
         
         # 3. Efficiency Penalty (Malus se il cuore deriva troppo rispetto ai watt)
+        # Opzionale: usa la finestra peggiore della curva di deriva (crollo finale non mediato)
+        if Config.DRIFT_PENALTY_USE_WORST_WINDOW and worst_drift is not None:
+            decoupling = max(decoupling, worst_drift)
         eff_penalty = max(0, decoupling - Config.DECOUPLING_THRESHOLD) * Config.DECOUPLING_PENALTY_FACTOR
         
         # 4. Intensity/HR Factor (Riserva Cardiaca usata)
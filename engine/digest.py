@@ -0,0 +1,82 @@
+import bisect
+from datetime import timedelta
+from config import Config
+from engine.core import ScoreEngine
+from engine.intervals import detect_intervals, summarize_intervals
+from engine.load import to_date
+
+# Da incrementare quando cambia il contenuto del digest: quelli vecchi vengono ricalcolati alla prima lettura
+DIGEST_VERSION = 1
+
+BASELINE_FIELDS = ("SCORE", "Power", "HR", "Decoupling")
+
+def _drift_summary(curve):
+    """Deriva finestra per finestra -> 3 numeri: peggiore, finale, minuto in cui supera la soglia."""
+    drift = (curve or {}).get("drift") or []
+    if not drift: return None
+    onset = next((t for t, d in zip(curve["t_min"], drift) if d > Config.DECOUPLING_THRESHOLD), None)
+    return {"worst_pct": round(max(drift) * 100, 1), "final_pct": round(drift[-1] * 100, 1), "onset_min": onset}
+
+def build_digest(run, ftp, baseline=None):
+    """
+    Contesto compatto di una corsa per il Coach AI e le analisi batch: zone, deriva, struttura, baseline.
+    Calcolato una volta in ingest dagli stream (e dalle feature già salvate); dopo non servono più gli stream.
+    """
+    dt = run.get('Stream_dt') or 1.0
+    segments = run.get('Segments')
+    if not isinstance(segments, list):
+        segments = detect_intervals(run['raw_watts'], run['raw_hr'], dt=dt)
+    curve = run.get('Drift_Curve')
+    if not isinstance(curve, dict):
+        curve = ScoreEngine().calculate_drift_curve(run['raw_watts'], run['raw_hr'], dt=dt)
+    duration = run.get('Duration')
+    return {
+        "v": DIGEST_VERSION, "ftp": ftp,
+        "duration_s": int(duration) if duration and duration == duration else round(len(run['raw_watts']) * dt), # NaN da DataFrame
+        "zones": ScoreEngine().calculate_zones(run['raw_watts'], ftp),
+        "drift": _drift_summary(curve),
+        "structure": summarize_intervals(segments),
+        "blocks": [[s["type"], s["dur_s"], s["avg_w"], s.get("avg_hr")] for s in segments[:Config.DIGEST_MAX_BLOCKS]],
+        "baseline": baseline.compare(run) if baseline is not None else None,
+    }
+
+def is_current(digest, ftp):
+    """Digest utilizzabile: versione attuale e stessa FTP delle zone."""
+    return isinstance(digest, dict) and digest.get("v") == DIGEST_VERSION and digest.get("ftp") == ftp
+
+class BaselineIndex:
+    """
+    Riferimento degli ultimi Config.DIGEST_BASELINE_DAYS giorni prima di ogni corsa.
+    Storico ordinato per data + bisect: ogni confronto costa O(log n + finestra), le corse nuove si inseriscono in ordine.
+    """
+    def __init__(self, history=()):
+        rows = sorted((to_date(r['Data']), [r.get(f) for f in BASELINE_FIELDS], r['id']) for r in history)
+        self.dates = [d for d, _, _ in rows]
+        self.values = [v for _, v, _ in rows]
+        self.ids = [i for _, _, i in rows]
+
+    def add(self, run):
+        if run['id'] in self.ids: # Corsa ricalcolata (modificata su Strava): sostituisce la precedente
+            j = self.ids.index(run['id'])
+            del self.dates[j], self.values[j], self.ids[j]
+        d = to_date(run['Data'])
+        i = bisect.bisect_right(self.dates, d)
+        self.dates.insert(i, d)
+        self.values.insert(i, [run.get(f) for f in BASELINE_FIELDS])
+        self.ids.insert(i, run['id'])
+
+    def compare(self, run):
+        """Medie della finestra (esclusa la corsa stessa) e scarto della corsa rispetto ad esse."""
+        d = to_date(run['Data'])
+        lo = bisect.bisect_left(self.dates, d - timedelta(days=Config.DIGEST_BASELINE_DAYS))
+        hi = bisect.bisect_left(self.dates, d)
+        window = [v for v, i in zip(self.values[lo:hi], self.ids[lo:hi]) if i != run['id']]
+        if not window: return None
+        out = {"days": Config.DIGEST_BASELINE_DAYS, "n": len(window)}
+        for j, f in enumerate(BASELINE_FIELDS):
+            vals = [v[j] for v in window if v[j] is not None]
+            if not vals or run.get(f) is None: continue
+            mean = sum(vals) / len(vals)
+            out[f] = round(mean, 2)
+            out[f"{f}_delta"] = round(run[f] - mean, 2)
+        return out
@@ -0,0 +1,94 @@
+import math
+import numpy as np
+from config import Config
+
+def _bin_means(x, size):
+    # Media per blocchi di 'size' campioni (reshape vettoriale, ultimo blocco parziale incluso)
+    n_full = len(x) // size * size
+    out = x[:n_full].reshape(-1, size).mean(axis=1)
+    if n_full < len(x):
+        out = np.append(out, x[n_full:].mean())
+    return out
+
+def _best_split(cs, a, b, min_len):
+    """Miglior punto di taglio in [a, b) con prefix sums: riduzione della devianza per ogni t, vettoriale."""
+    t = np.arange(a + min_len, b - min_len + 1)
+    if len(t) == 0: return None, 0.0
+    n_l, n_r = t - a, b - t
+    s_l, s_r, s = cs[t] - cs[a], cs[b] - cs[t], cs[b] - cs[a]
+    gain = s_l**2 / n_l + s_r**2 / n_r - s**2 / (b - a)
+    i = int(np.argmax(gain))
+    return int(t[i]), float(gain[i])
+
+def detect_intervals(watts_stream, hr_stream=None, dt=1.0):
+    """
+    Segmenta lo stream di potenza in blocchi di lavoro/recupero.
+    Binary segmentation su medie a blocchi (Config.INTERVAL_BIN_SEC): ogni ricerca del taglio
+    è una passata NumPy su somme cumulative, quindi il costo resta lineare anche su corse di ore.
+    Ritorna la lista dei segmenti con durata, potenza e FC medie.
+    """
+    if not watts_stream: return []
+    p = np.asarray(watts_stream, dtype=float)
+    h = np.asarray(hr_stream, dtype=float) if hr_stream is not None and len(hr_stream) == len(p) else None
+
+    size = max(1, int(round(Config.INTERVAL_BIN_SEC / dt)))
+    bin_sec = size * dt
+    x = _bin_means(p, size)
+    n = len(x)
+    min_len = max(1, int(math.ceil(Config.INTERVAL_MIN_SEC / bin_sec)))
+    if n < 2 * min_len: return []
+
+    # Rumore stimato dalle differenze successive (robusto ai salti): penalità tipo BIC
+    sigma = np.median(np.abs(np.diff(x))) / (0.6745 * math.sqrt(2)) if n > 1 else 0.0
+    penalty = Config.INTERVAL_PENALTY * max(sigma, 1.0)**2 * math.log(n)
+
+    cs = np.concatenate(([0.0], np.cumsum(x)))
+    bounds, stack = [0, n], [(0, n)]
+    while stack and len(bounds) - 1 < Config.INTERVAL_MAX_SEGMENTS:
+        a, b = stack.pop()
+        t, gain = _best_split(cs, a, b, min_len)
+        if t is None or gain < penalty: continue
+        bounds.append(t)
+        stack.extend([(a, t), (t, b)])
+    bounds.sort()
+
+    seg_means = np.array([(cs[b] - cs[a]) / (b - a) for a, b in zip(bounds[:-1], bounds[1:])])
+    lo, hi = seg_means.min(), seg_means.max()
+
+    # Lavoro/recupero solo se c'è vero contrasto tra i blocchi, altrimenti corsa continua
+    if hi <= 0 or (hi - lo) / hi < Config.INTERVAL_MIN_CONTRAST:
+        labels = ["steady"] * len(seg_means)
+    else:
+        labels = ["work" if m >= (lo + hi) / 2 else "rest" for m in seg_means]
+
+    # Fusione dei segmenti adiacenti con la stessa etichetta
+    merged = []
+    for (a, b), lbl in zip(zip(bounds[:-1], bounds[1:]), labels):
+        if merged and merged[-1][2] == lbl:
+            merged[-1][1] = b
+        else:
+            merged.append([a, b, lbl])
+
+    cs_p = np.concatenate(([0.0], np.cumsum(p)))
+    cs_h = np.concatenate(([0.0], np.cumsum(h))) if h is not None else None
+    segments = []
+    for a, b, lbl in merged:
+        i0, i1 = a * size, min(b * size, len(p))
+        seg = {"type": lbl, "start_s": round(i0 * dt), "dur_s": round((i1 - i0) * dt),
+               "avg_w": int(round((cs_p[i1] - cs_p[i0]) / (i1 - i0)))}
+        if cs_h is not None: seg["avg_hr"] = int(round((cs_h[i1] - cs_h[i0]) / (i1 - i0)))
+        segments.append(seg)
+    return segments
+
+def summarize_intervals(segments):
+    """Riepilogo compatto (per prompt AI e tabella): numero ripetute, durata e potenza media."""
+    work = [s for s in segments if s["type"] == "work"]
+    if not work: return {"structure": "continua", "n_work": 0}
+    dur = sum(s["dur_s"] for s in work)
+    return {
+        "structure": "intervalli" if len(work) >= 2 else "progressivo/variato",
+        "n_work": len(work),
+        "work_avg_dur_s": round(dur / len(work)),
+        "work_avg_w": round(sum(s["avg_w"] * s["dur_s"] for s in work) / dur),
+        "rest_avg_w": int(round(np.mean([s["avg_w"] for s in segments if s["type"] == "rest"]))) if len(work) < len(segments) else None
+    }
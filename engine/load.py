@@ -0,0 +1,106 @@
+import math
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from config import Config
+
+def normalized_power(watts_stream, dt=1.0):
+    """Normalized Power: media mobile 30s (somme cumulative), potenza alla 4a, radice 4a."""
+    if not watts_stream: return 0.0
+    p = np.asarray(watts_stream, dtype=float)
+    w = max(1, int(round(30 / dt)))
+    if len(p) < w: return float(p.mean())
+    cs = np.concatenate(([0.0], np.cumsum(p)))
+    rolling = (cs[w:] - cs[:-w]) / w
+    return float(np.mean(rolling ** 4) ** 0.25)
+
+def run_load(watts_stream, ftp, duration_sec, dt=1.0):
+    """Carico della corsa (stile TSS): ore * IF^2 * 100, con IF = NP / FTP."""
+    if not ftp or not duration_sec: return 0.0
+    intensity = normalized_power(watts_stream, dt) / ftp
+    return round(duration_sec / 3600 * intensity ** 2 * 100, 1)
+
+def summary_load(avg_power, ftp, duration_sec):
+    """Stima del carico da potenza media (corse salvate senza carico calcolato)."""
+    if not ftp or not duration_sec or not avg_power: return 0.0
+    return round(duration_sec / 3600 * (avg_power / ftp) ** 2 * 100, 1)
+
+def to_date(d):
+    if isinstance(d, datetime): return d.date()
+    if isinstance(d, date): return d
+    return datetime.strptime(str(d)[:10], "%Y-%m-%d").date()
+
+class TrainingLoad:
+    """
+    Modello Fitness/Fatica/Forma (CTL/ATL/TSB): medie esponenziali giornaliere del carico.
+    Lo stato è persistito per atleta e aggiornato in O(1) per ogni nuova corsa.
+    """
+    def __init__(self, ctl=0.0, atl=0.0, last_date=None):
+        self.ctl = ctl
+        self.atl = atl
+        self.last_date = to_date(last_date) if last_date else None
+
+    @staticmethod
+    def _k(tau):
+        return 1 - math.exp(-1 / tau)
+
+    @property
+    def tsb(self):
+        return self.ctl - self.atl
+
+    def update(self, run_date, load):
+        """
+        Aggiunge una corsa: decadimento per i giorni trascorsi + contributo del carico.
+        Ritorna False se la corsa è precedente all'ultimo stato (serve un backfill).
+        """
+        d = to_date(run_date)
+        if self.last_date is not None and d < self.last_date:
+            return False
+        days = (d - self.last_date).days if self.last_date else 0
+        k_ctl, k_atl = self._k(Config.CTL_DAYS), self._k(Config.ATL_DAYS)
+        self.ctl = self.ctl * (1 - k_ctl) ** days + k_ctl * load
+        self.atl = self.atl * (1 - k_atl) ** days + k_atl * load
+        self.last_date = d
+        return True
+
+    def at(self, day=None):
+        """Stato proiettato a una data (giorni senza corse = solo decadimento)."""
+        d = to_date(day or date.today())
+        days = max(0, (d - self.last_date).days) if self.last_date else 0
+        ctl = self.ctl * (1 - self._k(Config.CTL_DAYS)) ** days
+        atl = self.atl * (1 - self._k(Config.ATL_DAYS)) ** days
+        return {"CTL": round(ctl, 1), "ATL": round(atl, 1), "TSB": round(ctl - atl, 1)}
+
+    def to_dict(self):
+        return {"ctl": self.ctl, "atl": self.atl, "last_date": self.last_date.isoformat() if self.last_date else None}
+
+    @classmethod
+    def from_dict(cls, state):
+        if not state: return cls()
+        return cls(state.get("ctl", 0.0), state.get("atl", 0.0), state.get("last_date"))
+
+    @classmethod
+    def backfill(cls, history, ftp=None):
+        """
+        Ricostruisce tutto lo storico in un'unica passata vettoriale (serie giornaliera + EWM).
+        Ritorna (stato finale, DataFrame giornaliero CTL/ATL/TSB).
+        """
+        df = pd.DataFrame(history)
+        if df.empty: return cls(), pd.DataFrame(columns=["CTL", "ATL", "TSB"])
+
+        ftp = ftp or Config.DEFAULT_FTP
+        est = [summary_load(p, ftp, d) for p, d in zip(df["Power"], df.get("Duration", pd.Series(0, index=df.index)).fillna(0))]
+        loads = df["Load"].astype(float).fillna(pd.Series(est, index=df.index)) if "Load" in df.columns else pd.Series(est, index=df.index)
+
+        days = pd.to_datetime(df["Data"]).dt.normalize()
+        daily = loads.groupby(days).sum()
+        # Giorno zero a carico nullo: la ricorsione EWM parte dallo stato vuoto, come update()
+        idx = pd.date_range(daily.index.min() - pd.Timedelta(days=1), daily.index.max(), freq="D")
+        daily = daily.reindex(idx, fill_value=0.0)
+
+        ctl = daily.ewm(alpha=cls._k(Config.CTL_DAYS), adjust=False).mean()
+        atl = daily.ewm(alpha=cls._k(Config.ATL_DAYS), adjust=False).mean()
+        series = pd.DataFrame({"CTL": ctl, "ATL": atl, "TSB": ctl - atl}).iloc[1:]
+
+        state = cls(float(ctl.iloc[-1]), float(atl.iloc[-1]), idx[-1].date())
+        return state, series
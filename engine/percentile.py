@@ -0,0 +1,112 @@
+import bisect
+import threading
+from config import Config
+from engine.core import ScoreEngine
+
+class QuantileSketch:
+    """
+    Sketch incrementale dei quantili (centroidi ordinati, stile t-digest semplificato).
+    Inserimento e lookup in O(log n) sul numero di centroidi, memoria limitata.
+    """
+    def __init__(self, max_centroids=None):
+        self.max_centroids = max_centroids or Config.PERCENTILE_SKETCH_SIZE
+        self.means = []
+        self.counts = []
+        self.total = 0
+        self._cum = None # Prefissi cumulativi (ricostruiti solo quando servono)
+
+    def add(self, value, weight=1):
+        i = bisect.bisect_left(self.means, value)
+        if i < len(self.means) and self.means[i] == value:
+            self.counts[i] += weight
+        else:
+            self.means.insert(i, value)
+            self.counts.insert(i, weight)
+        self.total += weight
+        self._cum = None
+        if len(self.means) > self.max_centroids:
+            self._compress()
+
+    def _compress(self):
+        # Fusione greedy dei centroidi adiacenti (criterio t-digest): le code restano
+        # risolte finemente, il centro della distribuzione viene accorpato.
+        # Si scende a metà capienza così la compressione successiva è lontana (costo ammortizzato).
+        delta = self.max_centroids / 4
+        while len(self.means) > self.max_centroids // 2:
+            means, counts = [self.means[0]], [self.counts[0]]
+            acc = 0
+            for m, c in zip(self.means[1:], self.counts[1:]):
+                q = (acc + counts[-1] + c / 2) / self.total
+                if counts[-1] + c <= 4 * self.total * q * (1 - q) / delta:
+                    merged = counts[-1] + c
+                    means[-1] = (means[-1]*counts[-1] + m*c) / merged
+                    counts[-1] = merged
+                else:
+                    acc += counts[-1]
+                    means.append(m); counts.append(c)
+            self.means, self.counts = means, counts
+            delta /= 2
+
+    def rank(self, value):
+        """Frazione (0-1) della distribuzione inferiore o uguale a value."""
+        if not self.total: return 0.5
+        if self._cum is None:
+            cum, acc = [], 0
+            for c in self.counts:
+                cum.append(acc); acc += c
+            self._cum = cum
+
+        i = bisect.bisect_right(self.means, value)
+        if i == 0: return 0.0
+        if i == len(self.means): return 1.0
+
+        # Interpolazione lineare tra i centri dei due centroidi vicini
+        m0, m1 = self.means[i-1], self.means[i]
+        c0, c1 = self.counts[i-1], self.counts[i]
+        frac = (value - m0) / (m1 - m0) if m1 > m0 else 0.0
+        return (self._cum[i-1] + c0 / 2 + frac * (c0 + c1) / 2) / self.total
+
+class PercentileService:
+    """
+    Percentile empirico dello SCORE su tutti gli atleti, per fascia d'età e classe di distanza.
+    Ogni classe di distanza ha anche un bucket senza età (tutte le corse, comprese quelle senza età salvata):
+    si usa se la fascia d'età ha pochi campioni, poi la formula statistica di ScoreEngine.
+    """
+    def __init__(self, min_samples=None):
+        self.min_samples = min_samples or Config.PERCENTILE_MIN_SAMPLES
+        self.buckets = {}
+        self._lock = threading.Lock() # Condiviso tra le sessioni (st.cache_resource)
+
+    @staticmethod
+    def bucket_key(age, dist_km):
+        # age None -> bucket della sola classe di distanza
+        age_band = bisect.bisect_right(Config.PERCENTILE_AGE_BANDS, age) if age is not None else None
+        dist_class = bisect.bisect_right(Config.PERCENTILE_DISTANCE_CLASSES_KM, dist_km or 0)
+        return age_band, dist_class
+
+    def add(self, score, age, dist_km):
+        if score is None: return
+        keys = {self.bucket_key(None, dist_km), self.bucket_key(age, dist_km)}
+        with self._lock:
+            for key in keys:
+                if key not in self.buckets: self.buckets[key] = QuantileSketch()
+                self.buckets[key].add(float(score))
+
+    def build(self, rows):
+        """Popola l'indice da righe {'SCORE', 'Age', 'Dist (km)'} (Age NULL per le corse salvate prima dell'età)."""
+        for r in rows:
+            age = r.get('Age')
+            self.add(r.get('SCORE'), age if age == age else None, r.get('Dist (km)')) # NaN da DataFrame = assente
+        return self
+
+    def percentile(self, score, age, dist_km):
+        sketch = None
+        for key in (self.bucket_key(age, dist_km), self.bucket_key(None, dist_km)):
+            sketch = self.buckets.get(key)
+            if sketch is not None and sketch.total >= self.min_samples: break
+        else:
+            return ScoreEngine().age_adjusted_percentile(score, age)
+
+        with self._lock:
+            pct = sketch.rank(float(score)) * 100
+        return max(1.0, min(99.9, round(pct, 1)))
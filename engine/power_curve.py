@@ -0,0 +1,99 @@
+import bisect
+from datetime import date, timedelta
+import numpy as np
+from config import Config
+from engine.load import to_date
+
+def mean_max_power(watts_stream, dt=1.0, durations=None):
+    """
+    Curva di potenza media-massimale (MMP) per le durate della griglia Config.MMP_DURATIONS_SEC.
+    Somme cumulative: ogni durata è un massimo su finestre scorrevoli in O(n).
+    Le durate non risolvibili (più corte del passo dello stream o più lunghe della corsa) sono None.
+    """
+    durations = durations or Config.MMP_DURATIONS_SEC
+    empty = {"watts": [None] * len(durations), "full_sec": 0, "full_watts": None}
+    if not watts_stream: return empty
+
+    p = np.asarray(watts_stream, dtype=float)
+    n = len(p)
+    cs = np.concatenate(([0.0], np.cumsum(p)))
+
+    curve = []
+    for d in durations:
+        w = int(round(d / dt))
+        if w < 1 or (d < dt) or w > n:
+            curve.append(None)
+            continue
+        curve.append(round(float(((cs[w:] - cs[:-w]) / w).max()), 1))
+
+    # Punto finale: durata completa della corsa
+    return {"watts": curve, "full_sec": round(n * dt), "full_watts": round(float(cs[-1] / n), 1)}
+
+class PowerCurveEnvelope:
+    """
+    Inviluppo MMP per atleta: record assoluti e finestra mobile (Config.MMP_ROLLING_DAYS).
+    Ogni nuova corsa si fonde in O(durate): per il rolling ogni durata tiene una coda monotona
+    (date crescenti, watt decrescenti), quindi il massimo nella finestra è sempre in testa.
+    """
+    def __init__(self, all_time=None, rolling=None):
+        n = len(Config.MMP_DURATIONS_SEC)
+        self.all_time = all_time or [None] * n # [watt, data ISO] per durata
+        self.rolling = rolling or [[] for _ in range(n)] # [[data ISO, watt], ...] per durata
+
+    def add(self, run_date, curve_watts):
+        d = to_date(run_date).isoformat()
+        for i, v in enumerate(curve_watts or []):
+            if v is None: continue
+            if self.all_time[i] is None or v > self.all_time[i][0]:
+                self.all_time[i] = [v, d]
+            self._insert(self.rolling[i], d, v)
+        self._expire(date.today())
+
+    @staticmethod
+    def _insert(queue, d, v):
+        # Caso comune (sync cronologico): coda monotona classica, O(1) ammortizzato
+        if not queue or queue[-1][0] <= d:
+            while queue and queue[-1][1] <= v: queue.pop()
+            queue.append([d, v])
+            return
+        # Corsa fuori ordine (es. upgrade a piena risoluzione): dominata da una più recente con potenza >= v?
+        pos = bisect.bisect_left([q[0] for q in queue], d)
+        if any(w >= v for _, w in queue[pos:]): return
+        # Rimuove le corse precedenti (o dello stesso giorno) che v domina
+        keep = [q for q in queue[:pos] if q[1] > v]
+        queue[:] = keep + [[d, v]] + queue[pos:]
+
+    def _expire(self, today):
+        cutoff = (today - timedelta(days=Config.MMP_ROLLING_DAYS)).isoformat()
+        for queue in self.rolling:
+            while queue and queue[0][0] < cutoff:
+                queue.pop(0)
+
+    def curves(self, today=None):
+        """Inviluppi pronti per il grafico: {'all_time': [...], 'rolling': [...]}"""
+        cutoff = ((today or date.today()) - timedelta(days=Config.MMP_ROLLING_DAYS)).isoformat()
+        rolling = []
+        for queue in self.rolling:
+            valid = [w for d, w in queue if d >= cutoff]
+            rolling.append(valid[0] if valid else None) # Testa della coda = massimo
+        return {"all_time": [a[0] if a else None for a in self.all_time], "rolling": rolling}
+
+    def to_dict(self):
+        return {"durations": Config.MMP_DURATIONS_SEC, "all_time": self.all_time, "rolling": self.rolling}
+
+    @classmethod
+    def from_dict(cls, state):
+        # Griglia delle durate cambiata -> stato non più valido, serve un rebuild
+        if not state or state.get("durations") != Config.MMP_DURATIONS_SEC: return None
+        return cls(state.get("all_time"), state.get("rolling"))
+
+    @classmethod
+    def build(cls, runs):
+        """Ricostruisce l'inviluppo da corse salvate ({'Data', 'MMP'} o stream grezzi)."""
+        env = cls()
+        for r in sorted(runs, key=lambda r: str(r['Data'])):
+            mmp = r.get('MMP')
+            if not isinstance(mmp, dict):
+                mmp = mean_max_power(r.get('raw_watts'), r.get('Stream_dt') or 1.0)
+            env.add(r['Data'], mmp['watts'])
+        return env
@@ -0,0 +1,105 @@
+import heapq
+import numpy as np
+from config import Config
+
+FEATURES = ["Dist (km)", "Power", "HR", "Decoupling", "Temp", "W/kg"]
+
+def run_features(run, weight=None):
+    """Vettore di feature di una corsa (ordine FEATURES)."""
+    weight = weight or Config.DEFAULT_WEIGHT
+    try:
+        temp = float(str(run.get('Meteo', '')).replace('°C', ''))
+    except ValueError:
+        temp = 20.0 # Meteo mancante: temperatura di fallback usata anche in sync
+    power = float(run.get('Power') or 0)
+    return [float(run.get('Dist (km)') or 0), power, float(run.get('HR') or 0),
+            float(run.get('Decoupling') or 0), temp, power / weight]
+
+class _Node:
+    __slots__ = ("axis", "split", "left", "right", "idx")
+    def __init__(self, axis=None, split=None, left=None, right=None, idx=None):
+        self.axis, self.split, self.left, self.right, self.idx = axis, split, left, right, idx
+
+class RunIndex:
+    """
+    Ricerca delle corse più simili: KD-tree sulle feature normalizzate (z-score).
+    Le corse aggiunte dopo la build finiscono in un buffer scansionato in modo vettoriale;
+    quando il buffer supera Config.SIMILAR_REBUILD_RATIO dell'albero, l'indice viene ricostruito.
+    """
+    LEAF_SIZE = 16
+
+    def __init__(self, runs=(), weight=None):
+        self.weight = weight
+        self.ids, self.points = [], np.empty((0, len(FEATURES)))
+        self.pending_ids, self.pending = [], []
+        self.root = None
+        self._build([r['id'] for r in runs], [run_features(r, weight) for r in runs])
+
+    def __len__(self):
+        return len(self.ids) + len(self.pending_ids)
+
+    def _build(self, ids, raw):
+        raw = np.asarray(raw, dtype=float).reshape(-1, len(FEATURES))
+        self.ids = list(ids)
+        self._known = set(self.ids)
+        self.ids_arr = np.asarray(self.ids)
+        self.mu = raw.mean(axis=0) if len(raw) else np.zeros(len(FEATURES))
+        sd = raw.std(axis=0) if len(raw) else np.ones(len(FEATURES))
+        self.sd = np.where(sd > 0, sd, 1.0)
+        self.raw = raw
+        self.points = (raw - self.mu) / self.sd
+        self.pending_ids, self.pending = [], []
+        self.root = self._split(np.arange(len(raw))) if len(raw) else None
+
+    def _split(self, idx):
+        if len(idx) <= self.LEAF_SIZE:
+            return _Node(idx=idx)
+        # Asse con maggiore dispersione, taglio sulla mediana (argpartition O(n))
+        axis = int(np.argmax(self.points[idx].var(axis=0)))
+        mid = len(idx) // 2
+        order = idx[np.argpartition(self.points[idx, axis], mid)]
+        split = self.points[order[mid], axis]
+        return _Node(axis, split, self._split(order[:mid]), self._split(order[mid:]))
+
+    def add(self, run):
+        """Aggiornamento incrementale (sync): buffer + rebuild ammortizzato."""
+        if run['id'] in self._known: return
+        self._known.add(run['id'])
+        self.pending_ids.append(run['id'])
+        self.pending.append(run_features(run, self.weight))
+        if len(self.pending) > max(Config.SIMILAR_MIN_BUFFER, Config.SIMILAR_REBUILD_RATIO * len(self.ids)):
+            self._build(self.ids + self.pending_ids, np.vstack([self.raw, self.pending]))
+
+    def query(self, run, k=5):
+        """Le k corse più vicine (esclusa la corsa stessa): [(id, distanza), ...] in ordine."""
+        q = (np.asarray(run_features(run, self.weight)) - self.mu) / self.sd
+        heap = [] # max-heap (-dist, id) delle migliori k
+        exclude = run.get('id')
+
+        def consider(ids, pts):
+            if not len(ids): return
+            d = np.sqrt(((pts - q) ** 2).sum(axis=1))
+            # Solo i k migliori del blocco possono entrare nell'heap
+            for j in np.argsort(d)[:k + 1]:
+                i, dist = ids[j], float(d[j])
+                if i == exclude: continue
+                if len(heap) < k: heapq.heappush(heap, (-dist, i))
+                elif dist < -heap[0][0]: heapq.heapreplace(heap, (-dist, i))
+                else: break
+
+        def search(node):
+            if node is None: return
+            if node.idx is not None:
+                consider(self.ids_arr[node.idx], self.points[node.idx])
+                return
+            diff = q[node.axis] - node.split
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            search(near)
+            # Il ramo lontano serve solo se l'iperpiano è più vicino del k-esimo candidato
+            if len(heap) < k or abs(diff) < -heap[0][0]:
+                search(far)
+
+        search(self.root)
+        if self.pending:
+            consider(np.asarray(self.pending_ids), (np.asarray(self.pending) - self.mu) / self.sd)
+        return [(i.item() if hasattr(i, 'item') else i, round(-d, 3)) for d, i in sorted(heap, reverse=True)]
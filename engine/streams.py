@@ -0,0 +1,40 @@
+import numpy as np
+from config import Config
+
+def resample_streams(watts_stream, hr_stream, time_stream=None, duration_sec=None, max_gap=None):
+    """
+    Allinea Potenza/FC su una griglia a passo fisso usando lo stream 'time' di Strava (una volta sola, in ingest).
+    - Smart recording / tier ridotti: campioni a intervalli variabili -> interpolazione lineare sul tempo.
+    - Pause (auto-pausa, buchi > max_gap): il tempo fermo viene tolto, la corsa prosegue senza interpolare il vuoto.
+    Passo della griglia = intervallo mediano tra campioni (>= 1 s), quindi il numero di punti resta quello scaricato.
+    Senza stream 'time' (o con lunghezze diverse) i campioni restano quelli originali, con passo moving_time / n.
+    Ritorna {"watts", "hr", "dt", "duration"}: da qui in poi ogni campione vale dt secondi.
+    """
+    # Accetta liste (JSON Strava) o array NumPy (stream già puliti), restituisce sempre liste di interi
+    n = len(watts_stream) if watts_stream is not None else 0
+    if not n or hr_stream is None or len(hr_stream) != n: # Stream incoerenti: restano come sono (li scarta il chiamante)
+        return {"watts": list(watts_stream if watts_stream is not None else []), "hr": list(hr_stream if hr_stream is not None else []),
+                "dt": 1.0, "duration": duration_sec or n}
+
+    p = np.asarray(watts_stream, dtype=float)
+    h = np.asarray(hr_stream, dtype=float)
+    if time_stream is None or len(time_stream) != n or n < 2:
+        dt = duration_sec / n if duration_sec else 1.0
+        return {"watts": np.rint(p).astype(int).tolist(), "hr": np.rint(h).astype(int).tolist(),
+                "dt": dt, "duration": duration_sec or round(n * dt)}
+
+    t = np.asarray(time_stream, dtype=float)
+    steps = np.diff(t)
+    dt = max(1.0, float(np.median(steps)))
+
+    # Soglia di pausa: mai sotto qualche passo del tier (su 'low' i campioni distano anche minuti)
+    gap = max(max_gap or Config.STREAM_MAX_GAP_SEC, 3 * dt)
+    moving = np.concatenate(([0.0], np.cumsum(np.where(steps > gap, dt, np.maximum(steps, 0.0)))))
+
+    grid = np.arange(0.0, moving[-1] + dt / 2, dt)
+    return {
+        "watts": np.rint(np.interp(grid, moving, p)).astype(int).tolist(),
+        "hr": np.rint(np.interp(grid, moving, h)).astype(int).tolist(),
+        "dt": dt,
+        "duration": int(round(len(grid) * dt)),
+    }
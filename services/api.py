@@ -1,9 +1,66 @@
 import google.generativeai as genai
+import copy
 import json
 import requests
+import threading
 import time
 from datetime import datetime, timedelta
 
+class SingleFlight:
+    """
+    Registro process-wide delle richieste in volo: chiamate identiche e concorrenti
+    (stessa chiave) condividono un'unica chiamata di rete e il suo risultato.
+    """
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.stats = {} # {tipo: {"calls": n, "coalesced": n}}
+
+    def do(self, key, fn):
+        kind = key[0]
+        with self._lock:
+            counters = self.stats.setdefault(kind, {"calls": 0, "coalesced": 0})
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = SingleFlight._Call()
+                counters["calls"] += 1
+            else:
+                counters["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error: raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+
+# Unico registro per processo: condiviso tra sessioni Streamlit e thread di sync
+INFLIGHT = SingleFlight()
+
+# Risposta 304 a una richiesta condizionale: la risorsa salvata è ancora valida
+NOT_MODIFIED = object()
+
+def coalescing_stats():
+    """Chiamate reali vs richieste servite da una chiamata già in volo (budget API risparmiato)."""
+    with INFLIGHT._lock:
+        return {k: dict(v) for k, v in INFLIGHT.stats.items()}
+
 class AICoachService:
     def __init__(self, api_key):
         if not api_key:
@@ -14,19 +71,43 @@ class AICoachService:
         genai.configure(api_key=api_key)
         self.model = genai.GenerativeModel('gemini-pro')
 
-    def get_feedback(self, run_data, zones):
+    def get_feedback(self, run_data, digest):
+        """Feedback del coach dal digest della corsa (zone, deriva, struttura, baseline): nessun accesso agli stream."""
         if not self.model: return "⚠️ API Key Gemini mancante."
-        
-        prompt = f"""
+        return self._generate(self.build_prompt(run_data, digest))
+
+    def build_prompt(self, run_data, digest):
+        duration = digest.get('duration_s') or 0
+
+        # Struttura della seduta (blocchi lavoro/recupero rilevati sullo stream)
+        structure = "Non disponibile."
+        if digest.get('blocks'):
+            structure = "\n".join(
+                f"- {t.upper()}: {d // 60}:{d % 60:02d} min @ {w} W" + (f", {h} bpm" if h else "")
+                for t, d, w, h in digest['blocks'])
+
+        drift = digest.get('drift') or {}
+        drift_txt = "Non disponibile."
+        if drift:
+            drift_txt = f"Peggiore {drift['worst_pct']}%, finale {drift['final_pct']}%" + (
+                f", soglia superata al minuto {drift['onset_min']}" if drift.get('onset_min') is not None else ", mai sopra soglia")
+
+        base = digest.get('baseline')
+        base_txt = "Nessuna corsa di riferimento."
+        if base:
+            base_txt = f"{base['n']} corse negli ultimi {base['days']} giorni. " + ", ".join(
+                f"{f} medio {base[f]} ({base[f + '_delta']:+})" for f in ("SCORE", "Power", "HR", "Decoupling") if f in base)
+
+        return f"""
         Agisci come un allenatore di corsa d'élite (stile Jack Daniels o Joe Friel).
         Analizza questa sessione di allenamento e dammi un feedback breve, diretto e motivante (max 100 parole).
         Usa formattazione Markdown (grassetti, elenchi).
 
         DATI ATLETA:
-        - Data: {run_data.get('Data')}
+        - Data: {str(run_data.get('Data'))[:10]}
         - Distanza: {run_data.get('Dist (km)')} km
-        - Tempo: {run_data.get('moving_time', 0) // 60} minuti
-        - Passo Medio: {self._format_pace(run_data.get('moving_time', 0), run_data.get('Dist (km)'))} min/km
+        - Tempo: {duration // 60} minuti
+        - Passo Medio: {self._format_pace(duration, run_data.get('Dist (km)'))} min/km
         - Potenza Media: {run_data.get('Power')} W
         - FC Media: {run_data.get('HR')} bpm
         - Disaccoppiamento Aerobico (Drift): {run_data.get('Decoupling')}% (Sopra il 5% indica fatica/inefficienza)
@@ -34,14 +115,24 @@ class AICoachService:
         - Livello: {run_data.get('Rank')}
 
         DISTRIBUZIONE ZONE (Importante):
-        {json.dumps(zones, indent=2)}
+        {json.dumps(digest.get('zones'), indent=2)}
+
+        DERIVA CARDIACA (finestre di 10 min):
+        {drift_txt}
+
+        STRUTTURA SEDUTA (Lavoro/Recupero):
+        {structure}
+
+        CONFRONTO CON LO STORICO RECENTE:
+        {base_txt}
 
         ANALISI RICHIESTA:
-        1. Valuta se l'obiettivo (basato sulle zone) è stato centrato.
-        2. Commenta il disaccoppiamento (è alto?).
+        1. Valuta se l'obiettivo (basato sulle zone e sulla struttura della seduta) è stato centrato.
+        2. Commenta il disaccoppiamento (è alto?) e il confronto con le ultime settimane.
         3. Dai un consiglio per la prossima volta.
         """
 
+    def _generate(self, prompt):
         try:
             response = self.model.generate_content(prompt)
             return response.text
@@ -64,24 +155,14 @@ class WeatherService:
         Recupera Meteo REALE storico da Open-Meteo.
         """
         try:
-            # Open-Meteo richiede start_date e end_date
-            params = {
-                "latitude": lat,
-                "longitude": lon,
-                "start_date": date_str,
-                "end_date": date_str,
-                "hourly": "temperature_2m,relative_humidity_2m"
-            }
-            res = requests.get(WeatherService.BASE_URL, params=params, timeout=5)
-            
-            if res.status_code == 200:
-                data = res.json()
-                if "hourly" in data:
-                    # Troviamo l'indice dell'ora richiesta (0-23)
-                    idx = min(hour, 23)
-                    temp = data["hourly"]["temperature_2m"][idx]
-                    hum = data["hourly"]["relative_humidity_2m"][idx]
-                    return float(temp), float(hum)
+            # Una sola chiamata per località/giorno anche con richieste concorrenti
+            hourly = INFLIGHT.do(("weather", lat, lon, date_str), lambda: WeatherService._fetch_day(lat, lon, date_str))
+            if hourly:
+                # Troviamo l'indice dell'ora richiesta (0-23)
+                idx = min(hour, 23)
+                temp = hourly["temperature_2m"][idx]
+                hum = hourly["relative_humidity_2m"][idx]
+                return float(temp), float(hum)
             
             # Fallback in caso di risposta strana
             return 20.0, 50.0
@@ -90,12 +171,30 @@ class WeatherService:
             print(f"⚠️ Weather Error: {e}")
             return 20.0, 50.0 # Fallback Safe
 
+    @staticmethod
+    def _fetch_day(lat, lon, date_str):
+        # Open-Meteo richiede start_date e end_date
+        params = {
+            "latitude": lat,
+            "longitude": lon,
+            "start_date": date_str,
+            "end_date": date_str,
+            "hourly": "temperature_2m,relative_humidity_2m"
+        }
+        res = requests.get(WeatherService.BASE_URL, params=params, timeout=5)
+        if res.status_code == 200:
+            return res.json().get("hourly")
+        return None
+
 
 class StravaService:
     def __init__(self, client_id, client_secret):
         self.client_id = client_id
         self.client_secret = client_secret
         self.base_url = "https://www.strava.com/api/v3"
+        self.transfer_bytes = {} # Byte scaricati per tipo di richiesta (es. stream per risoluzione)
+        self.not_modified = {}   # Richieste condizionali risolte con 304 (nessun byte scaricato)
+        self._stats_lock = threading.Lock()
     
     def get_link(self, redirect_uri):
         return f"https://www.strava.com/oauth/authorize?client_id={self.client_id}&response_type=code&redirect_uri={redirect_uri}&approval_prompt=force&scope=activity:read_all"
@@ -114,14 +213,28 @@ class StravaService:
             pass
         return None
 
-    def _request_with_retry(self, method, url, headers=None, params=None, max_retries=3):
-        """Wrapper con gestione Rate Limit e Retries"""
+    def _request_with_retry(self, method, url, headers=None, params=None, max_retries=3, stats_key=None, etag=None):
+        """
+        Wrapper con gestione Rate Limit e Retries.
+        etag: richiesta condizionale (If-None-Match) -> ritorna (dati | NOT_MODIFIED | None, ETag della risposta).
+        """
+        conditional = etag is not None
+        if etag:
+            headers = {**(headers or {}), "If-None-Match": etag}
         for i in range(max_retries):
             try:
                 res = requests.request(method, url, headers=headers, params=params, timeout=10)
                 
+                if res.status_code == 304 and conditional:
+                    with self._stats_lock:
+                        self.not_modified[stats_key] = self.not_modified.get(stats_key, 0) + 1
+                    return NOT_MODIFIED, etag
+
                 if res.status_code == 200:
-                    return res.json()
+                    if stats_key:
+                        with self._stats_lock:
+                            self.transfer_bytes[stats_key] = self.transfer_bytes.get(stats_key, 0) + len(res.content)
+                    return (res.json(), res.headers.get("ETag")) if conditional else res.json()
                 
                 if res.status_code == 429:
                     # Rate Limit
@@ -131,13 +244,13 @@ class StravaService:
                 
                 # Altri errori (401, 500)
                 print(f"⚠️ Strava API Error {res.status_code}: {res.text}")
-                return None
+                break
                 
             except requests.exceptions.RequestException as e:
                 print(f"⚠️ Network Error: {e}")
                 time.sleep(2)
         
-        return None
+        return (None, None) if conditional else None
 
     def fetch_activities(self, token, days_back=365):
         headers = {"Authorization": f"Bearer {token}"}
@@ -161,7 +274,27 @@ class StravaService:
             
         return all_activities
 
-    def fetch_streams(self, token, activity_id):
+    def fetch_streams(self, token, activity_id, resolution=None):
+        """
+        Stream time/watts/heartrate/cadence. resolution: None = piena risoluzione (1 Hz),
+        oppure 'low'/'medium'/'high' (~100/1000/10000 punti, ricampionati da Strava).
+        Lo stream 'time' (secondi dall'inizio) serve a riallineare i campioni su una griglia a passo fisso,
+        'cadence' (se presente) a riconoscere la FC ottica agganciata al passo.
+        """
+        return self.fetch_streams_conditional(token, activity_id, resolution)[0]
+
+    def fetch_streams_conditional(self, token, activity_id, resolution=None, etag=None):
+        """
+        Come fetch_streams, con If-None-Match sull'ETag salvato: ritorna (stream | NOT_MODIFIED | None, ETag).
+        Se Strava non espone l'ETag si scarica sempre (ETag None).
+        """
         headers = {"Authorization": f"Bearer {token}"}
-        url = f"{self.base_url}/activities/{activity_id}/streams?keys=watts,heartrate&key_by_type=true"
-        return self._request_with_retry("GET", url, headers=headers)
+        url = f"{self.base_url}/activities/{activity_id}/streams?keys=time,watts,heartrate,cadence&key_by_type=true"
+        if resolution:
+            url += f"&resolution={resolution}&series_type=time"
+        stats_key = f"streams_{resolution or 'full'}"
+        # Sync e Laboratorio concorrenti sulla stessa attività (e stesso token: niente dati di un altro atleta) condividono il download
+        data, new_etag = INFLIGHT.do(("streams", token, activity_id, resolution, etag),
+                                     lambda: self._request_with_retry("GET", url, headers=headers, stats_key=stats_key, etag=etag or ""))
+        # Copia per chiamante: il risultato condiviso non va mutato da chi lo riceve
+        return (copy.deepcopy(data) if isinstance(data, dict) else data), new_etag
@@ -0,0 +1,145 @@
+import argparse
+import json
+import time
+import uuid
+from config import Config
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError: # Dipendenza opzionale: serve solo per export/import massivi
+    pa = pc = ds = None
+
+# Chiavi di raw_data salvate come colonne dedicate; tutte le altre (feature derivate) finiscono in 'features' (JSON)
+STREAM_KEYS = ("watts", "hr", "dt", "resolution", "original_size", "age")
+
+def _schema():
+    return pa.schema([
+        ("id", pa.int64()), ("athlete_id", pa.int64()), ("month", pa.string()), ("date", pa.string()),
+        ("distance_km", pa.float64()), ("duration_sec", pa.int64()), ("avg_power", pa.float64()), ("avg_hr", pa.float64()),
+        ("decoupling", pa.float64()), ("score", pa.float64()), ("wcf", pa.float64()), ("wr_pct", pa.float64()),
+        ("rank", pa.string()), ("meteo_desc", pa.string()), ("athlete_age", pa.float64()), ("load", pa.float64()),
+        ("ai_feedback", pa.string()),
+        ("watts", pa.list_(pa.float32())), ("hr", pa.list_(pa.float32())),
+        ("stream_dt", pa.float64()), ("stream_res", pa.string()), ("stream_size", pa.int64()),
+        ("features", pa.string()),
+    ])
+
+# Colonne di riepilogo (lettura selettiva: Parquet legge solo queste, niente stream)
+SUMMARY_FIELDS = ["id", "athlete_id", "month", "date", "distance_km", "duration_sec", "avg_power", "avg_hr",
+                  "decoupling", "score", "rank", "meteo_desc", "athlete_age", "load"]
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow non installato: `pip install pyarrow` per export/import Parquet.")
+
+def _to_batch(rows, schema):
+    """Righe formato DB -> RecordBatch colonnare."""
+    cols = {f.name: [] for f in schema}
+    for r in rows:
+        raw = r.get("raw_data") or {}
+        date = str(r["date"])[:10]
+        for c in ("id", "athlete_id", "date", "distance_km", "duration_sec", "avg_power", "avg_hr", "decoupling",
+                  "score", "wcf", "wr_pct", "rank", "meteo_desc", "load", "ai_feedback"):
+            cols[c].append(r.get(c))
+        cols["athlete_age"].append(raw.get("age")) # In archivio colonna dedicata (letture di riepilogo)
+        cols["date"][-1] = date
+        cols["month"].append(date[:7])
+        cols["watts"].append(raw.get("watts"))
+        cols["hr"].append(raw.get("hr"))
+        cols["stream_dt"].append(raw.get("dt", 1.0))
+        cols["stream_res"].append(raw.get("resolution", "full"))
+        cols["stream_size"].append(raw.get("original_size"))
+        cols["features"].append(json.dumps({k: v for k, v in raw.items() if k not in STREAM_KEYS}))
+    return pa.RecordBatch.from_pydict(cols, schema=schema)
+
+def _int_streams(batch):
+    # Stream interi (caso Strava) tornano int: il JSON del backend si serializza molto più in fretta.
+    # Il cast "safe" di Arrow fallisce se c'è anche un solo valore decimale: in quel caso restano float.
+    for name in ("watts", "hr"):
+        i = batch.schema.get_field_index(name)
+        try:
+            batch = batch.set_column(i, name, pc.cast(batch.column(i), pa.list_(pa.int32())))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    return batch
+
+def _from_batch(batch):
+    """RecordBatch -> righe formato DB (pronte per import_rows)."""
+    rows = []
+    for r in _int_streams(batch).to_pylist():
+        raw = json.loads(r.pop("features") or "{}")
+        raw.update({"watts": r.pop("watts"), "hr": r.pop("hr"), "dt": r.pop("stream_dt"),
+                    "resolution": r.pop("stream_res"), "original_size": r.pop("stream_size"), "age": r.pop("athlete_age")})
+        r.pop("month", None)
+        r["raw_data"] = raw
+        rows.append(r)
+    return rows
+
+def export_parquet(db, out_dir, batch_size=None):
+    """
+    Esporta runs + stream in Parquet partizionato athlete_id=/month=/ (hive).
+    Scrittura in streaming: in memoria c'è al più un blocco di righe per partizione aperta.
+    """
+    _require_pyarrow()
+    batch_size = batch_size or Config.ARCHIVE_BATCH_ROWS
+    schema = _schema()
+    stats = {"rows": 0}
+
+    def batches():
+        for rows in db.iter_rows(batch_size):
+            stats["rows"] += len(rows)
+            yield _to_batch(rows, schema)
+
+    ds.write_dataset(
+        batches(), out_dir, schema=schema, format="parquet",
+        partitioning=ds.partitioning(pa.schema([("athlete_id", pa.int64()), ("month", pa.string())]), flavor="hive"),
+        basename_template=f"part-{uuid.uuid4().hex[:8]}-{{i}}.parquet",
+        existing_data_behavior="delete_matching", # Riesportare nella stessa directory sostituisce le partizioni, non le duplica
+        max_rows_per_group=batch_size, min_rows_per_group=min(batch_size, 1024),
+        max_open_files=Config.ARCHIVE_MAX_OPEN_FILES,
+    )
+    return stats["rows"]
+
+def _dataset(path):
+    return ds.dataset(path, format="parquet", partitioning="hive", schema=_schema())
+
+def import_parquet(db, in_dir, batch_size=None, athlete_id=None):
+    """Importa un archivio Parquet nel backend (upsert a blocchi, memoria limitata)."""
+    _require_pyarrow()
+    batch_size = batch_size or Config.ARCHIVE_BATCH_ROWS
+    flt = ds.field("athlete_id") == athlete_id if athlete_id else None
+    n = 0
+    for batch in _dataset(in_dir).to_batches(batch_size=batch_size, filter=flt):
+        if batch.num_rows:
+            n += db.import_rows(_from_batch(batch))
+    return n
+
+def read_summaries(in_dir, athlete_id=None):
+    """Solo le colonne di riepilogo come DataFrame (analisi offline senza toccare gli stream)."""
+    _require_pyarrow()
+    flt = ds.field("athlete_id") == athlete_id if athlete_id else None
+    return _dataset(in_dir).to_table(columns=SUMMARY_FIELDS, filter=flt).to_pandas()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export/import Parquet dello storico SCORE")
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("path", help="Directory dell'archivio Parquet")
+    parser.add_argument("--db", help="Database SQLite locale (default: backend configurato nei secrets)")
+    parser.add_argument("--athlete", type=int, help="Import di un solo atleta")
+    args = parser.parse_args()
+
+    if args.db:
+        from services.local_db import LocalDatabaseService
+        db = LocalDatabaseService(args.db)
+    else:
+        from services.db import create_database_service
+        db = create_database_service()
+
+    t0 = time.perf_counter()
+    if args.action == "export":
+        n = export_parquet(db, args.path)
+    else:
+        n = import_parquet(db, args.path, athlete_id=args.athlete)
+    print(f"{args.action}: {n} corse in {time.perf_counter() - t0:.1f}s")
@@ -1,5 +1,10 @@
 import streamlit as st
 from supabase import create_client, Client
+from config import Config
+from services.records import SUMMARY_COLUMNS, raw_data_payload, run_duration, run_to_row, row_to_run, row_to_summary
+
+# Riepilogo + età (in raw_data): JSON path lato server, gli stream non escono dal DB
+SUMMARY_SELECT = ", ".join(SUMMARY_COLUMNS) + ", age:raw_data->age"
 
 class DatabaseService:
     def __init__(self, url, key):
@@ -8,39 +13,38 @@ class DatabaseService:
     def update_ai_feedback(self, run_id, feedback_text):
         """Salva il commento dell'AI nel DB per non rigenerarlo."""
         try:
-            self.client.table("runs").update({"ai_feedback": feedback_text}).eq("id", run_id).execute()
+            self.supabase.table("runs").update({"ai_feedback": feedback_text}).eq("id", run_id).execute()
             return True
         except Exception as e:
             print(f"Errore update AI: {e}")
             return False
 
+    def update_streams(self, run_data):
+        """Sostituisce stream e feature derivate salvati (es. upgrade a piena risoluzione)."""
+        try:
+            self.supabase.table("runs").update({
+                "raw_data": raw_data_payload(run_data),
+                "duration_sec": run_duration(run_data)
+            }).eq("id", run_data['id']).execute()
+            return True
+        except Exception as e:
+            print(f"Errore update stream: {e}")
+            return False
+
     def save_run(self, run_data, athlete_id):
         """Salva o aggiorna una corsa nel DB (Upsert)"""
-        # Prepariamo il payload per Supabase
-        payload = {
-            "id": run_data['id'],
-            "athlete_id": athlete_id,
-            "date": run_data['Data'],
-            "distance_km": run_data['Dist (km)'],
-            "duration_sec": len(run_data['raw_watts']), # Stima approx
-            "avg_power": run_data['Power'],
-            "avg_hr": run_data['HR'],
-            "decoupling": run_data['Decoupling'],
-            "score": run_data['SCORE'],
-            "wcf": run_data['WCF'],
-            "wr_pct": run_data['WR_Pct'],
-            "rank": run_data['Rank'],
-            "meteo_desc": run_data['Meteo'],
-            # Serializziamo i dati grezzi in JSON
-            "raw_data": {
-                "watts": run_data['raw_watts'],
-                "hr": run_data['raw_hr']
-            }
-        }
-        
         try:
             # upsert = insert or update se l'ID esiste già
-            self.supabase.table("runs").upsert(payload).execute()
+            self.supabase.table("runs").upsert(run_to_row(run_data, athlete_id)).execute()
+            return True
+        except Exception as e:
+            st.error(f"Errore DB Save: {e}")
+            return False
+
+    def save_runs(self, runs, athlete_id):
+        """Upsert di più corse in una sola richiesta (writer della sync)"""
+        try:
+            self.supabase.table("runs").upsert([run_to_row(r, athlete_id) for r in runs]).execute()
             return True
         except Exception as e:
             st.error(f"Errore DB Save: {e}")
@@ -55,28 +59,147 @@ class DatabaseService:
             # if athlete_id: query = query.eq("athlete_id", athlete_id)
             
             response = query.execute()
-            data = response.data
             
             # Riconvertiamo il formato DB nel formato App
-            processed = []
-            for row in data:
-                processed.append({
-                    "id": row['id'],
-                    "Data": row['date'],
-                    "Dist (km)": row['distance_km'],
-                    "Power": row['avg_power'],
-                    "HR": row['avg_hr'],
-                    "Decoupling": row['decoupling'],
-                    "WCF": row['wcf'],
-                    "SCORE": row['score'],
-                    "WR_Pct": row['wr_pct'],
-                    "Rank": row['rank'],
-                    "Meteo": row['meteo_desc'],
-                    # Estraiamo i dati grezzi dal JSONB
-                    "raw_watts": row['raw_data']['watts'],
-                    "raw_hr": row['raw_data']['hr']
-                })
-            return processed
+            return [row_to_run(row) for row in response.data]
         except Exception as e:
             st.error(f"Errore DB Load: {e}")
             return []
+
+    def _select_all(self, columns, athlete_id=None, page_size=1000):
+        """Legge tutte le righe di runs (solo le colonne richieste) a pagine: Supabase limita le righe per risposta"""
+        start, rows = 0, []
+        while True:
+            query = self.supabase.table("runs").select(columns)
+            if athlete_id: query = query.eq("athlete_id", athlete_id)
+            response = query.range(start, start + page_size - 1).execute()
+            rows.extend(response.data)
+            if len(response.data) < page_size: break
+            start += page_size
+        return rows
+
+    def get_score_population(self):
+        """Carica solo SCORE, età e distanza di tutti gli atleti (per l'indice percentile)"""
+        try:
+            rows = self._select_all("score, distance_km, age:raw_data->age")
+            return [{"SCORE": r['score'], "Dist (km)": r['distance_km'], "Age": r.get('age')} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Population: {e}")
+            return []
+
+    def get_run_summaries(self, athlete_id=None):
+        """Storico completo senza stream grezzi (calibrazione, analisi batch)"""
+        try:
+            rows = self._select_all(SUMMARY_SELECT, athlete_id)
+            return [row_to_summary(r) for r in rows]
+        except Exception as e:
+            print(f"Errore DB Summaries: {e}")
+            return []
+
+    def get_run_digests(self, athlete_id=None):
+        """Riepiloghi + digest + curva MMP (JSON path lato server: gli stream grezzi non escono dal DB)"""
+        try:
+            rows = self._select_all(SUMMARY_SELECT + ", digest:raw_data->digest, mmp:raw_data->mmp", athlete_id)
+            return [{**row_to_summary(r), "Digest": r.get('digest'), "MMP": r.get('mmp')} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Digests: {e}")
+            return []
+
+    def get_run_curves(self, athlete_id=None):
+        """Riepiloghi + curva MMP salvata; stream potenza solo per le corse senza MMP (salvate prima delle curve)"""
+        try:
+            rows = self._select_all(SUMMARY_SELECT + ", mmp:raw_data->mmp", athlete_id)
+            missing = [r['id'] for r in rows if not r.get('mmp')]
+            streams = {}
+            for i in range(0, len(missing), 100):
+                response = self.supabase.table("runs").select("id, watts:raw_data->watts, dt:raw_data->dt").in_("id", missing[i:i + 100]).execute()
+                streams.update({s['id']: s for s in response.data})
+            return [{**row_to_summary(r), "MMP": r.get('mmp'), "raw_watts": streams.get(r['id'], {}).get('watts'),
+                     "Stream_dt": streams.get(r['id'], {}).get('dt')} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Curves: {e}")
+            return []
+
+    def get_run_fingerprints(self, athlete_id=None):
+        """Riepiloghi + stato di sync (impronta, ETag, tier) per decidere cosa riscaricare"""
+        try:
+            rows = self._select_all(SUMMARY_SELECT + ", fingerprint:raw_data->>fingerprint, etag:raw_data->>etag, "
+                                    "resolution:raw_data->>resolution", athlete_id)
+            return [{**row_to_summary(r), "Fingerprint": r.get('fingerprint'), "Stream_ETag": r.get('etag'),
+                     "Stream_Res": r.get('resolution')} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Fingerprints: {e}")
+            return []
+
+    def get_run(self, run_id):
+        """Una corsa completa (stream compresi), None se non esiste"""
+        try:
+            response = self.supabase.table("runs").select("*").eq("id", run_id).execute()
+            return row_to_run(response.data[0]) if response.data else None
+        except Exception as e:
+            print(f"Errore DB Run: {e}")
+            return None
+
+    def get_athlete_state(self, athlete_id):
+        """Stato incrementale per atleta (modelli aggiornati in O(1) ad ogni sync)"""
+        try:
+            response = self.supabase.table("athlete_state").select("state").eq("athlete_id", athlete_id).execute()
+            return response.data[0]['state'] if response.data else {}
+        except Exception as e:
+            print(f"Errore DB State Load: {e}")
+            return {}
+
+    def save_athlete_state(self, athlete_id, state):
+        try:
+            self.supabase.table("athlete_state").upsert({"athlete_id": athlete_id, "state": state}).execute()
+            return True
+        except Exception as e:
+            print(f"Errore DB State Save: {e}")
+            return False
+
+    def get_all_rows(self):
+        """Tutte le righe complete (formato DB), per idratare la cache locale"""
+        return self._select_all("*")
+
+    def iter_rows(self, batch_size=500):
+        """Righe complete (formato DB) a blocchi, ordinate per id: memoria limitata a un blocco"""
+        start = 0
+        while True:
+            response = self.supabase.table("runs").select("*").order("id").range(start, start + batch_size - 1).execute()
+            if response.data: yield response.data
+            if len(response.data) < batch_size: break
+            start += batch_size
+
+    def import_rows(self, rows, chunk_size=500):
+        """Upsert massivo di righe già in formato DB (import archivio)"""
+        for i in range(0, len(rows), chunk_size):
+            self.supabase.table("runs").upsert(rows[i:i + chunk_size]).execute()
+        return len(rows)
+
+    def push_pending(self):
+        """Scritture dirette su Supabase: niente in sospeso (interfaccia comune con la cache SQLite)"""
+        return 0
+
+def create_database_service():
+    """
+    Backend di storage da secrets [storage] backend:
+    'supabase' (default), 'sqlite' (store locale primario), 'sqlite+supabase' (cache locale + sync remoto).
+    """
+    from services.local_db import LocalDatabaseService
+
+    storage = Config.get_storage_settings()
+    backend = storage.get("backend", "supabase")
+    path = storage.get("path", Config.LOCAL_DB_PATH)
+
+    if backend == "sqlite":
+        return LocalDatabaseService(path)
+
+    supa_creds = Config.get_supabase_creds()
+    remote = DatabaseService(supa_creds["url"], supa_creds["key"])
+    if backend != "sqlite+supabase":
+        return remote
+
+    local = LocalDatabaseService(path, remote)
+    if local.is_empty(): local.pull_remote() # Prima apertura: idratazione della cache
+    else: local.push_pending() # Scritture remote fallite nelle sessioni precedenti
+    return local
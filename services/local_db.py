@@ -0,0 +1,330 @@
+import json
+import os
+import sqlite3
+import threading
+import streamlit as st
+from services.records import SUMMARY_COLUMNS, raw_data_payload, run_duration, run_to_row, row_to_run, row_to_summary
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    athlete_id INTEGER,
+    date TEXT NOT NULL,
+    distance_km REAL,
+    duration_sec INTEGER,
+    avg_power REAL,
+    avg_hr REAL,
+    decoupling REAL,
+    score REAL,
+    wcf REAL,
+    wr_pct REAL,
+    rank TEXT,
+    meteo_desc TEXT,
+    load REAL,
+    ai_feedback TEXT,
+    raw_data TEXT,
+    synced INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_runs_athlete_date ON runs (athlete_id, date DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_date ON runs (date DESC);
+CREATE INDEX IF NOT EXISTS idx_runs_unsynced ON runs (synced) WHERE synced = 0;
+
+CREATE TABLE IF NOT EXISTS athlete_state (
+    athlete_id INTEGER PRIMARY KEY,
+    state TEXT NOT NULL,
+    synced INTEGER NOT NULL DEFAULT 1
+);
+"""
+
+# Riepilogo + età (in raw_data): json_extract, gli stream non arrivano in Python
+SUMMARY_SELECT = ", ".join(SUMMARY_COLUMNS) + ", json_extract(raw_data, '$.age') AS age"
+
+RUN_COLUMNS = ["id", "athlete_id", "date", "distance_km", "duration_sec", "avg_power", "avg_hr", "decoupling",
+               "score", "wcf", "wr_pct", "rank", "meteo_desc", "load", "ai_feedback", "raw_data"]
+
+class LocalDatabaseService:
+    """
+    Backend SQLite embedded con la stessa interfaccia di DatabaseService.
+    Da solo è lo store primario (offline, test); con 'remote' fa da cache locale:
+    letture solo locali, scritture locali + write-through su Supabase.
+    Le scritture remote fallite restano marcate (synced = 0) e si ritentano con push_pending().
+    """
+    def __init__(self, path, remote=None):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.remote = remote
+        self._lock = threading.Lock() # Connessione condivisa tra thread e sessioni
+
+    # --- Helpers ---
+    def _migrate(self):
+        # Cache create con la colonna athlete_age: l'età passa in raw_data come sul backend remoto
+        cols = [r['name'] for r in self.conn.execute("PRAGMA table_info(runs)")]
+        if "athlete_age" in cols:
+            with self.conn:
+                self.conn.execute("UPDATE runs SET raw_data = json_set(raw_data, '$.age', athlete_age) "
+                                  "WHERE athlete_age IS NOT NULL AND raw_data IS NOT NULL AND json_extract(raw_data, '$.age') IS NULL")
+
+    @staticmethod
+    def _to_db(row, synced=1):
+        row = dict(row)
+        row["date"] = str(row["date"])[:10]
+        row["raw_data"] = json.dumps(row["raw_data"]) if row.get("raw_data") is not None else None
+        values = [row.get(c) for c in RUN_COLUMNS]
+        return values + [synced]
+
+    @staticmethod
+    def _from_db(r):
+        row = dict(r)
+        if row.get("raw_data"): row["raw_data"] = json.loads(row["raw_data"])
+        return row
+
+    def _upsert_rows(self, rows, synced=1):
+        cols = RUN_COLUMNS + ["synced"]
+        # synced: una riga già in sospeso resta in sospeso (es. ai_feedback non replicato, che l'upsert remoto non porta)
+        sets = [f"{c} = excluded.{c}" for c in RUN_COLUMNS if c not in ('id', 'ai_feedback')] + ["synced = MIN(runs.synced, excluded.synced)"]
+        sql = (f"INSERT INTO runs ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))}) "
+               f"ON CONFLICT(id) DO UPDATE SET {', '.join(sets)}")
+        with self._lock, self.conn:
+            self.conn.executemany(sql, [self._to_db(r, synced) for r in rows])
+
+    def _remote_ok(self, fn, *args):
+        # Write-through opzionale: un errore remoto non blocca la scrittura locale
+        if not self.remote: return True
+        try:
+            return bool(fn(*args))
+        except Exception as e:
+            print(f"Errore sync Supabase: {e}")
+            return False
+
+    # --- Interfaccia DatabaseService ---
+    def update_ai_feedback(self, run_id, feedback_text):
+        """Salva il commento dell'AI nel DB per non rigenerarlo."""
+        try:
+            synced = int(self._remote_ok(self.remote.update_ai_feedback if self.remote else None, run_id, feedback_text))
+            with self._lock, self.conn:
+                self.conn.execute("UPDATE runs SET ai_feedback = ?, synced = MIN(synced, ?) WHERE id = ?", (feedback_text, synced, run_id))
+            return True
+        except Exception as e:
+            print(f"Errore update AI: {e}")
+            return False
+
+    def update_streams(self, run_data):
+        """Sostituisce stream e feature derivate salvati (es. upgrade a piena risoluzione)."""
+        try:
+            synced = int(self._remote_ok(self.remote.update_streams if self.remote else None, run_data))
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "UPDATE runs SET raw_data = ?, duration_sec = ?, synced = MIN(synced, ?) WHERE id = ?",
+                    (json.dumps(raw_data_payload(run_data)), run_duration(run_data), synced, run_data['id']))
+            return True
+        except Exception as e:
+            print(f"Errore update stream: {e}")
+            return False
+
+    def save_run(self, run_data, athlete_id):
+        """Salva o aggiorna una corsa nel DB (Upsert)"""
+        try:
+            synced = int(self._remote_ok(self.remote.save_run if self.remote else None, run_data, athlete_id))
+            self._upsert_rows([run_to_row(run_data, athlete_id)], synced)
+            return True
+        except Exception as e:
+            st.error(f"Errore DB Save: {e}")
+            return False
+
+    def save_runs(self, runs, athlete_id):
+        """Upsert di più corse in una sola transazione (writer della sync)"""
+        try:
+            synced = int(self._remote_ok(self.remote.save_runs if self.remote else None, runs, athlete_id))
+            self._upsert_rows([run_to_row(r, athlete_id) for r in runs], synced)
+            return True
+        except Exception as e:
+            st.error(f"Errore DB Save: {e}")
+            return False
+
+    def get_history(self, athlete_id=None, limit=50):
+        """Carica lo storico dal DB"""
+        try:
+            sql, args = f"SELECT {', '.join(RUN_COLUMNS)} FROM runs", []
+            if athlete_id:
+                sql += " WHERE athlete_id = ?"; args.append(athlete_id)
+            sql += " ORDER BY date DESC"
+            if limit:
+                sql += " LIMIT ?"; args.append(limit)
+            with self._lock:
+                rows = self.conn.execute(sql, args).fetchall()
+            return [row_to_run(self._from_db(r)) for r in rows]
+        except Exception as e:
+            st.error(f"Errore DB Load: {e}")
+            return []
+
+    def get_score_population(self):
+        """Carica solo SCORE, età e distanza di tutti gli atleti (per l'indice percentile)"""
+        try:
+            with self._lock:
+                rows = self.conn.execute("SELECT score, distance_km, json_extract(raw_data, '$.age') AS age FROM runs").fetchall()
+            return [{"SCORE": r['score'], "Dist (km)": r['distance_km'], "Age": r['age']} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Population: {e}")
+            return []
+
+    def get_run_summaries(self, athlete_id=None):
+        """Storico completo senza stream grezzi (calibrazione, analisi batch)"""
+        try:
+            sql, args = f"SELECT {SUMMARY_SELECT} FROM runs", []
+            if athlete_id:
+                sql += " WHERE athlete_id = ?"; args.append(athlete_id)
+            with self._lock:
+                rows = self.conn.execute(sql, args).fetchall()
+            return [row_to_summary(dict(r)) for r in rows]
+        except Exception as e:
+            print(f"Errore DB Summaries: {e}")
+            return []
+
+    def get_run_digests(self, athlete_id=None):
+        """Riepiloghi + digest + curva MMP (json_extract in SQLite: gli stream grezzi non arrivano in Python)"""
+        try:
+            sql, args = (f"SELECT {SUMMARY_SELECT}, json_extract(raw_data, '$.digest') AS digest, "
+                         "json_extract(raw_data, '$.mmp') AS mmp FROM runs"), []
+            if athlete_id:
+                sql += " WHERE athlete_id = ?"; args.append(athlete_id)
+            with self._lock:
+                rows = self.conn.execute(sql, args).fetchall()
+            return [{**row_to_summary(dict(r)), "Digest": json.loads(r['digest']) if r['digest'] else None,
+                     "MMP": json.loads(r['mmp']) if r['mmp'] else None} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Digests: {e}")
+            return []
+
+    def get_run_curves(self, athlete_id=None):
+        """Riepiloghi + curva MMP salvata; stream potenza solo per le corse senza MMP (salvate prima delle curve)"""
+        try:
+            sql, args = (f"SELECT {SUMMARY_SELECT}, json_extract(raw_data, '$.mmp') AS mmp, "
+                         "CASE WHEN json_extract(raw_data, '$.mmp') IS NULL THEN json_extract(raw_data, '$.watts') END AS watts, "
+                         "json_extract(raw_data, '$.dt') AS dt FROM runs"), []
+            if athlete_id:
+                sql += " WHERE athlete_id = ?"; args.append(athlete_id)
+            with self._lock:
+                rows = self.conn.execute(sql, args).fetchall()
+            return [{**row_to_summary(dict(r)), "MMP": json.loads(r['mmp']) if r['mmp'] else None,
+                     "raw_watts": json.loads(r['watts']) if r['watts'] else None, "Stream_dt": r['dt']} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Curves: {e}")
+            return []
+
+    def get_run_fingerprints(self, athlete_id=None):
+        """Riepiloghi + stato di sync (impronta, ETag, tier) per decidere cosa riscaricare"""
+        try:
+            sql, args = (f"SELECT {SUMMARY_SELECT}, json_extract(raw_data, '$.fingerprint') AS fingerprint, "
+                         "json_extract(raw_data, '$.etag') AS etag, json_extract(raw_data, '$.resolution') AS resolution FROM runs"), []
+            if athlete_id:
+                sql += " WHERE athlete_id = ?"; args.append(athlete_id)
+            with self._lock:
+                rows = self.conn.execute(sql, args).fetchall()
+            return [{**row_to_summary(dict(r)), "Fingerprint": r['fingerprint'], "Stream_ETag": r['etag'],
+                     "Stream_Res": r['resolution']} for r in rows]
+        except Exception as e:
+            print(f"Errore DB Fingerprints: {e}")
+            return []
+
+    def get_run(self, run_id):
+        """Una corsa completa (stream compresi), None se non esiste"""
+        try:
+            with self._lock:
+                r = self.conn.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE id = ?", (run_id,)).fetchone()
+            return row_to_run(self._from_db(r)) if r else None
+        except Exception as e:
+            print(f"Errore DB Run: {e}")
+            return None
+
+    def get_athlete_state(self, athlete_id):
+        """Stato incrementale per atleta (modelli aggiornati in O(1) ad ogni sync)"""
+        try:
+            with self._lock:
+                r = self.conn.execute("SELECT state FROM athlete_state WHERE athlete_id = ?", (athlete_id,)).fetchone()
+            return json.loads(r['state']) if r else {}
+        except Exception as e:
+            print(f"Errore DB State Load: {e}")
+            return {}
+
+    def save_athlete_state(self, athlete_id, state):
+        try:
+            synced = int(self._remote_ok(self.remote.save_athlete_state if self.remote else None, athlete_id, state))
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT INTO athlete_state (athlete_id, state, synced) VALUES (?, ?, ?) "
+                    "ON CONFLICT(athlete_id) DO UPDATE SET state = excluded.state, synced = excluded.synced",
+                    (athlete_id, json.dumps(state), synced))
+            return True
+        except Exception as e:
+            print(f"Errore DB State Save: {e}")
+            return False
+
+    def get_all_rows(self):
+        """Tutte le righe complete (formato DB)"""
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs").fetchall()
+        return [self._from_db(r) for r in rows]
+
+    def iter_rows(self, batch_size=500):
+        """Righe complete (formato DB) a blocchi: memoria limitata a un blocco"""
+        with self._lock:
+            cur = self.conn.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs ORDER BY id")
+            rows = cur.fetchmany(batch_size)
+        while rows:
+            yield [self._from_db(r) for r in rows]
+            with self._lock:
+                rows = cur.fetchmany(batch_size)
+
+    def import_rows(self, rows):
+        """Upsert massivo di righe già in formato DB (import archivio), una sola transazione + write-through"""
+        synced = int(self._remote_ok(self.remote.import_rows if self.remote else None, rows))
+        self._upsert_rows(rows, synced)
+        self._copy_ai_feedback(rows)
+        return len(rows)
+
+    def _copy_ai_feedback(self, rows):
+        # ai_feedback non viene sovrascritto dall'upsert: lo copiamo a parte
+        with self._lock, self.conn:
+            self.conn.executemany("UPDATE runs SET ai_feedback = ? WHERE id = ?",
+                                  [(r['ai_feedback'], r['id']) for r in rows if r.get('ai_feedback')])
+
+    # --- Sync con Supabase ---
+    def is_empty(self):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM runs LIMIT 1").fetchone() is None
+
+    def pull_remote(self):
+        """Idrata la cache locale con tutto lo storico remoto (una volta, all'avvio)."""
+        if not self.remote: return 0
+        rows = self.remote.get_all_rows()
+        self._upsert_rows(rows, synced=1)
+        self._copy_ai_feedback(rows)
+        return len(rows)
+
+    def push_pending(self, chunk_size=500):
+        """
+        Ritenta su Supabase le corse e gli stati rimasti solo in locale (synced = 0), a blocchi.
+        Righe complete in formato DB: con la corsa viaggia anche ai_feedback.
+        """
+        if not self.remote: return 0
+        with self._lock:
+            runs = self.conn.execute(f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE synced = 0").fetchall()
+            states = self.conn.execute("SELECT athlete_id, state FROM athlete_state WHERE synced = 0").fetchall()
+        pushed = 0
+        for i in range(0, len(runs), chunk_size):
+            rows = [self._from_db(r) for r in runs[i:i + chunk_size]]
+            if self._remote_ok(self.remote.import_rows, rows):
+                with self._lock, self.conn:
+                    self.conn.executemany("UPDATE runs SET synced = 1 WHERE id = ?", [(r['id'],) for r in rows])
+                pushed += len(rows)
+        for s in states:
+            if self._remote_ok(self.remote.save_athlete_state, s['athlete_id'], json.loads(s['state'])):
+                with self._lock, self.conn:
+                    self.conn.execute("UPDATE athlete_state SET synced = 1 WHERE athlete_id = ?", (s['athlete_id'],))
+        return pushed
@@ -0,0 +1,104 @@
+# Mappatura tra il formato App (chiavi 'Data', 'Dist (km)', ...) e le righe della tabella runs.
+# Condivisa da tutti i backend di storage (Supabase, SQLite locale).
+
+# Colonne lette dalle query di riepilogo (niente stream grezzi); l'età è in raw_data ('age'), letta per JSON path
+SUMMARY_COLUMNS = ["id", "athlete_id", "date", "distance_km", "duration_sec", "avg_power", "avg_hr",
+                   "decoupling", "score", "rank", "meteo_desc", "load"]
+
+def _feature(run_data, key):
+    # Feature derivate assenti arrivano da un DataFrame come NaN: nel JSON vanno come null
+    v = run_data.get(key)
+    return v if isinstance(v, (dict, list)) else None
+
+def _text(run_data, key):
+    v = run_data.get(key)
+    return v if isinstance(v, str) else None
+
+def raw_data_payload(run_data):
+    """Payload JSONB con stream grezzi e feature derivate"""
+    age = run_data.get('Age')
+    return {
+        "watts": run_data['raw_watts'],
+        "hr": run_data['raw_hr'],
+        "drift_curve": _feature(run_data, 'Drift_Curve'),
+        "mmp": _feature(run_data, 'MMP'),
+        "segments": _feature(run_data, 'Segments'),
+        "digest": _feature(run_data, 'Digest'),
+        "quality": _feature(run_data, 'Quality'),
+        "age": age if age == age else None, # Età dell'atleta alla data della corsa (NaN da DataFrame = assente)
+        # Stato di sync: impronta del riepilogo Strava ed ETag della richiesta stream (tier di 'resolution')
+        "fingerprint": _text(run_data, 'Fingerprint'),
+        "etag": _text(run_data, 'Stream_ETag'),
+        # Tier dello stream: risoluzione, punti originali (1 Hz) e passo medio in secondi
+        "resolution": run_data.get('Stream_Res', 'full'),
+        "original_size": run_data.get('Stream_Size'),
+        "dt": run_data.get('Stream_dt', 1.0)
+    }
+
+def run_duration(run_data):
+    """Durata in movimento (stream 'time'/moving_time), altrimenti punti x passo dello stream"""
+    return run_data.get('Duration') or round(len(run_data['raw_watts']) * (run_data.get('Stream_dt') or 1.0))
+
+def run_to_row(run_data, athlete_id):
+    """Formato App -> riga runs"""
+    return {
+        "id": run_data['id'],
+        "athlete_id": athlete_id,
+        "date": run_data['Data'],
+        "distance_km": run_data['Dist (km)'],
+        "duration_sec": run_duration(run_data),
+        "avg_power": run_data['Power'],
+        "avg_hr": run_data['HR'],
+        "decoupling": run_data['Decoupling'],
+        "score": run_data['SCORE'],
+        "wcf": run_data['WCF'],
+        "wr_pct": run_data['WR_Pct'],
+        "rank": run_data['Rank'],
+        "meteo_desc": run_data['Meteo'],
+        "load": run_data.get('Load'),
+        # Serializziamo i dati grezzi in JSON
+        "raw_data": raw_data_payload(run_data)
+    }
+
+def row_to_run(row):
+    """Riga runs -> formato App"""
+    raw = row['raw_data']
+    return {
+        "id": row['id'],
+        "Data": row['date'],
+        "Dist (km)": row['distance_km'],
+        "Power": row['avg_power'],
+        "HR": row['avg_hr'],
+        "Decoupling": row['decoupling'],
+        "WCF": row['wcf'],
+        "SCORE": row['score'],
+        "WR_Pct": row['wr_pct'],
+        "Rank": row['rank'],
+        "Meteo": row['meteo_desc'],
+        "Age": raw.get('age'),
+        "Load": row.get('load'),
+        "ai_feedback": row.get('ai_feedback'),
+        # Estraiamo i dati grezzi dal JSONB
+        "raw_watts": raw['watts'],
+        "raw_hr": raw['hr'],
+        "Drift_Curve": raw.get('drift_curve'),
+        "MMP": raw.get('mmp'),
+        "Segments": raw.get('segments'),
+        "Digest": raw.get('digest'),
+        "Quality": raw.get('quality'),
+        "Fingerprint": raw.get('fingerprint'),
+        "Stream_ETag": raw.get('etag'),
+        "Duration": row.get('duration_sec'),
+        "Stream_Res": raw.get('resolution', 'full'),
+        "Stream_Size": raw.get('original_size'),
+        "Stream_dt": raw.get('dt', 1.0)
+    }
+
+def row_to_summary(r):
+    """Riga runs (solo SUMMARY_COLUMNS) -> riepilogo App"""
+    return {
+        "id": r['id'], "athlete_id": r['athlete_id'], "Data": r['date'],
+        "Dist (km)": r['distance_km'], "Duration": r['duration_sec'], "Power": r['avg_power'], "HR": r['avg_hr'],
+        "Decoupling": r['decoupling'], "SCORE": r['score'], "Rank": r['rank'], "Meteo": r['meteo_desc'],
+        "Age": r.get('age'), "Load": r.get('load')
+    }
@@ -0,0 +1,133 @@
+import argparse
+import html
+import os
+import time
+import pandas as pd
+from config import Config
+
+PERIODS = {"weekly": "W", "monthly": "M"}
+ZONES = ["Z1", "Z2", "Z3", "Z4", "Z5"]
+EFFORTS = [(d, f"{d // 60}min" if d >= 60 else f"{d}s") for d in Config.REPORT_MMP_DURATIONS_SEC]
+
+def _frame(rows):
+    """Riepiloghi + digest + MMP -> DataFrame con minuti per zona (zone % x durata) e punti MMP."""
+    df = pd.DataFrame(rows)
+    df["Data"] = pd.to_datetime(df["Data"])
+    df["Duration"] = pd.to_numeric(df["Duration"], errors="coerce") # Senza durata: minuti per zona vuoti, non zero
+    zones = pd.DataFrame([((d or {}).get("zones") or {}) for d in df.get("Digest", [None] * len(df))], index=df.index)
+    minutes = df["Duration"] / 60 / 100
+    for z in ZONES:
+        df[f"{z}_min"] = zones[z].astype(float) * minutes if z in zones else float("nan")
+    # Best efforts: punti della curva MMP salvata (stessa griglia Config.MMP_DURATIONS_SEC)
+    curves = [((m or {}).get("watts") or []) if isinstance(m, dict) else [] for m in df.get("MMP", [None] * len(df))]
+    for d, label in EFFORTS:
+        i = Config.MMP_DURATIONS_SEC.index(d)
+        df[f"mmp_{label}"] = pd.to_numeric(pd.Series([c[i] if i < len(c) else None for c in curves], index=df.index), errors="coerce")
+    return df
+
+def _drift_outliers(df):
+    # Deriva anomala rispetto allo storico dell'atleta stesso: z-score robusto (mediana/MAD)
+    dec = df["Decoupling"].astype(float)
+    med = dec.groupby(df["athlete_id"]).transform("median")
+    mad = (dec - med).abs().groupby(df["athlete_id"]).transform("median") * 1.4826
+    return (dec - med) > Config.REPORT_DRIFT_Z * mad.clip(lower=Config.REPORT_DRIFT_MIN_MAD)
+
+def build_reports(rows, period="weekly"):
+    """
+    Report per atleta x periodo in una passata: volume, trend SCORE, zone, best efforts (MMP), record, derive anomale.
+    Tutte le aggregazioni sono group-by vettoriali sull'intero storico (tutti gli atleti insieme).
+    """
+    if not rows: return pd.DataFrame()
+    df = _frame(rows)
+    df["period"] = df["Data"].dt.to_period(PERIODS[period]).dt.start_time
+    df["outlier"] = _drift_outliers(df)
+    keys = ["athlete_id", "period"]
+    g = df.groupby(keys)
+
+    rep = g.agg(
+        runs=("id", "size"), km=("Dist (km)", "sum"), hours=("Duration", "sum"), load=("Load", "sum"),
+        score=("SCORE", "mean"), score_max=("SCORE", "max"), power=("Power", "mean"),
+        decoupling=("Decoupling", "mean"), drift_outliers=("outlier", "sum"),
+        **{f"{z}_min": (f"{z}_min", "sum") for z in ZONES},
+    )
+    rep["hours"] = rep["hours"] / 3600
+    # Periodi senza digest: zone vuote, non zero
+    has_zones = g["Z1_min"].count() > 0
+    for z in ZONES: rep[f"{z}_min"] = rep[f"{z}_min"].where(has_zones)
+    # Trend: media SCORE del periodo contro quella del periodo precedente dello stesso atleta
+    rep["score_trend"] = rep.groupby(level="athlete_id")["score"].diff()
+
+    # Record e best efforts: riga del massimo per gruppo (idxmax vettoriale)
+    bests = [("SCORE", "best_score"), ("Dist (km)", "longest")] + [(f"mmp_{label}", f"best_{label}") for _, label in EFFORTS]
+    for col, label in bests:
+        valid = df.dropna(subset=[col]) # Gruppi senza valori (es. corse senza potenza): nessun record, niente errore
+        best = df.loc[valid.groupby(keys)[col].idxmax()]
+        rep[f"{label}_date"] = best.set_index(keys)["Data"].dt.strftime("%Y-%m-%d")
+        rep[label] = best.set_index(keys)[col]
+
+    out = df[df["outlier"]]
+    rep["outlier_runs"] = (out["Data"].dt.strftime("%d/%m") + " (" + out["Decoupling"].astype(str) + "%)").groupby(
+        [out["athlete_id"], out["period"]]).agg(", ".join)
+    return rep.round(2)
+
+def _md_table(df):
+    cols = list(df.columns)
+    lines = ["| " + " | ".join(cols) + " |", "|" + "---|" * len(cols)]
+    lines += ["| " + " | ".join("" if pd.isna(v) else str(v) for v in row) + " |" for row in df.itertuples(index=False)]
+    return "\n".join(lines)
+
+def _sections(rep_athlete):
+    """Tabelle di un atleta (periodi dal più recente), condivise da Markdown e HTML."""
+    r = rep_athlete.sort_index(ascending=False).reset_index()
+    r["period"] = r["period"].dt.strftime("%Y-%m-%d")
+    volume = r[["period", "runs", "km", "hours", "load", "score", "score_trend", "decoupling"]]
+    zones = r[["period"] + [f"{z}_min" for z in ZONES]]
+    best = r[["period", "best_score", "best_score_date", "longest", "longest_date"]]
+    efforts = r[["period"] + [c for _, label in EFFORTS for c in (f"best_{label}", f"best_{label}_date")]]
+    drift = r.loc[r["drift_outliers"] > 0, ["period", "drift_outliers", "outlier_runs"]]
+    return [("Volume e SCORE", volume), ("Minuti per zona", zones), ("Best efforts (W, curva di potenza)", efforts),
+            ("Migliori prestazioni", best), ("Derive anomale", drift)]
+
+def render_markdown(rep_athlete, athlete_id, period):
+    parts = [f"# Report {period} - atleta {athlete_id}"]
+    for title, table in _sections(rep_athlete):
+        parts += [f"## {title}", _md_table(table) if len(table) else "_Nessuna._"]
+    return "\n\n".join(parts) + "\n"
+
+def render_html(rep_athlete, athlete_id, period):
+    parts = [f"<h1>Report {period} - atleta {html.escape(str(athlete_id))}</h1>"]
+    for title, table in _sections(rep_athlete):
+        parts += [f"<h2>{title}</h2>", table.to_html(index=False, na_rep="", border=0) if len(table) else "<p><em>Nessuna.</em></p>"]
+    return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>SCORE report</title>"
+            "<style>body{font-family:sans-serif} table{border-collapse:collapse} td,th{padding:4px 8px;border-bottom:1px solid #eee}</style>"
+            "</head><body>" + "\n".join(parts) + "</body></html>")
+
+def write_reports(db, out_dir, period="weekly", fmt="md"):
+    """Una lettura di tutte le corse (riepiloghi + digest + curva MMP, niente stream), un file per atleta."""
+    rep = build_reports(db.get_run_digests(), period)
+    if rep.empty: return 0
+    os.makedirs(out_dir, exist_ok=True)
+    render = render_html if fmt == "html" else render_markdown
+    for aid, rep_athlete in rep.groupby(level="athlete_id"):
+        with open(os.path.join(out_dir, f"{aid}_{period}.{fmt}"), "w", encoding="utf-8") as f:
+            f.write(render(rep_athlete.droplevel("athlete_id"), aid, period))
+    return rep.index.get_level_values("athlete_id").nunique()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report settimanali/mensili di tutti gli atleti")
+    parser.add_argument("period", choices=list(PERIODS))
+    parser.add_argument("out_dir", help="Directory di output")
+    parser.add_argument("--format", choices=["md", "html"], default="md")
+    parser.add_argument("--db", help="Database SQLite locale (default: backend configurato nei secrets)")
+    args = parser.parse_args()
+
+    if args.db:
+        from services.local_db import LocalDatabaseService
+        db = LocalDatabaseService(args.db)
+    else:
+        from services.db import create_database_service
+        db = create_database_service()
+
+    t0 = time.perf_counter()
+    n = write_reports(db, args.out_dir, args.period, args.format)
+    print(f"{n} atleti in {time.perf_counter() - t0:.1f}s")
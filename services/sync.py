@@ -0,0 +1,193 @@
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import hashlib
+import json
+import multiprocessing
+import queue
+import threading
+from datetime import datetime
+from config import Config
+from engine.analysis import analyze_activity
+from services.api import NOT_MODIFIED, WeatherService
+
+_DONE = object() # Sentinella di fine stadio
+
+# Pool di analisi unico per processo: l'avvio dei worker (import di numpy/engine) si paga una volta sola
+_POOL, _POOL_LOCK = None, threading.Lock()
+
+def _analysis_pool(workers):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            # 'spawn': niente fork di un processo con thread attivi (Streamlit, fetcher)
+            _POOL = concurrent.futures.ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        return _POOL
+
+def _drop_pool(pool):
+    # Worker morto (OOM, kill): il pool resta rotto per sempre, il prossimo sync ne crea uno nuovo
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool: _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _inline(s, data, params):
+    fut = concurrent.futures.Future()
+    try:
+        fut.set_result(analyze_activity(s, data[0], data[1], params))
+    except Exception as e:
+        fut.set_exception(e)
+    return fut
+
+def summary_fingerprint(s):
+    """Impronta dei campi del riepilogo Strava usati dall'analisi (Config.SYNC_FINGERPRINT_FIELDS)"""
+    payload = json.dumps([s.get(f) for f in Config.SYNC_FINGERPRINT_FIELDS], sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+def _legacy_match(s, row):
+    # Corse salvate prima delle impronte: confronto sui valori del riepilogo già in tabella
+    return (row.get('Dist (km)') == round(s.get('distance', 0) / 1000, 2) and row.get('Power') == int(s.get('average_watts', 0))
+            and row.get('HR') == int(s.get('average_heartrate', 0)))
+
+def plan_sync(activities, known):
+    """
+    Divide il riepilogo Strava in (nuove, modificate) rispetto alle corse salvate (known: {id: riga con 'Fingerprint'}).
+    Le corse invariate non costano nessuna richiesta.
+    """
+    new, changed = [], []
+    for s in activities:
+        row = known.get(s['id'])
+        if row is None:
+            new.append(s)
+            continue
+        fp = row.get('Fingerprint')
+        if (fp != summary_fingerprint(s)) if fp else not _legacy_match(s, row):
+            changed.append(s)
+    return new, changed
+
+def _stored_streams(run):
+    # Stream salvati (passo fisso Stream_dt) nel formato Strava: la ricampionatura li lascia invariati.
+    # 'cleaned': già puliti in ingest, l'analisi non li ripulisce e tiene la qualità misurata sugli originali
+    dt = run.get('Stream_dt') or 1.0
+    return {"watts": {"data": run['raw_watts'], "original_size": run.get('Stream_Size')},
+            "heartrate": {"data": run['raw_hr']}, "time": {"data": [i * dt for i in range(len(run['raw_watts']))]},
+            "cleaned": {"quality": run.get('Quality')}}
+
+class SyncPipeline:
+    """
+    Sync a stadi separati da code limitate:
+    fetch stream + meteo (thread, I/O) -> analisi (pool di processi, CPU) -> scrittura a blocchi (thread chiamante).
+    Ogni stadio ha la sua concorrenza; una coda piena blocca lo stadio a monte (backpressure),
+    quindi i download non superano mai l'analisi di più di Config.SYNC_QUEUE_SIZE attività.
+    Corse già salvate (modificate su Strava): stream richiesti con If-None-Match, su 304 si rianalizzano quelli salvati.
+    """
+    def __init__(self, strava, token, db, athlete_id, params, baseline=None, etags=None,
+                 fetch_workers=None, cpu_workers=None, write_batch=None, queue_size=None):
+        self.strava, self.token, self.db, self.athlete_id = strava, token, db, athlete_id
+        self.params = params # weight, hr_max, hr_rest, ftp, age, resolution
+        self.baseline = baseline # BaselineIndex dello storico: completa il digest con il confronto a 28 giorni
+        self.etags = etags or {} # {id: ETag} degli stream salvati allo stesso tier
+        self.fetch_workers = fetch_workers or Config.SYNC_FETCH_WORKERS
+        self.cpu_workers = Config.SYNC_CPU_WORKERS if cpu_workers is None else cpu_workers
+        self.write_batch = write_batch or Config.SYNC_WRITE_BATCH
+        self.queue_size = queue_size or Config.SYNC_QUEUE_SIZE
+
+    # --- Stadio 1: I/O ---
+    def _fetch(self, s):
+        streams, etag = self.strava.fetch_streams_conditional(self.token, s['id'], self.params.get('resolution'), self.etags.get(s['id']))
+        if streams is NOT_MODIFIED:
+            stored = self.db.get_run(s['id'])
+            streams = _stored_streams(stored) if stored and stored.get('raw_watts') else None
+        if not streams or 'watts' not in streams or 'heartrate' not in streams: return None
+        t, h = 20.0, 50.0 # Meteo Reale se c'è la posizione
+        lat_lng = s.get('start_latlng', [])
+        if lat_lng:
+            dt = datetime.strptime(s['start_date_local'], "%Y-%m-%dT%H:%M:%SZ")
+            t, h = WeatherService.get_weather(lat_lng[0], lat_lng[1], dt.strftime("%Y-%m-%d"), dt.hour)
+        return streams, (t, h), etag
+
+    def _fetcher(self, todo, fetched):
+        while True:
+            try:
+                s = todo.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                fetched.put((s, self._fetch(s)))
+            except Exception as e:
+                print(f"Error fetching {s['id']}: {e}")
+                fetched.put((s, None))
+        fetched.put(_DONE)
+
+    # --- Stadio 2: CPU ---
+    def _dispatcher(self, fetched, analyzed, pool):
+        finished = 0
+        try:
+            while finished < self.fetch_workers:
+                item = fetched.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                s, data = item
+                fut = None # Stream mancanti: conta solo per il progresso
+                if data is not None and pool:
+                    try:
+                        fut = pool.submit(analyze_activity, s, data[0], data[1], self.params)
+                    except (BrokenProcessPool, RuntimeError) as e:
+                        print(f"Analysis pool unavailable, continuing inline: {e}")
+                        _drop_pool(pool)
+                        pool = None
+                if data is not None and fut is None:
+                    fut = _inline(s, data, self.params)
+                analyzed.put((s, fut, data)) # In ordine di invio: al più queue_size analisi in volo
+        finally:
+            analyzed.put(_DONE) # Anche se lo stadio muore: il writer non resta in attesa
+
+    # --- Stadio 3: scrittura ---
+    def _flush(self, batch, saved):
+        if batch and self.db.save_runs(batch, self.athlete_id):
+            saved.extend(batch)
+        batch.clear()
+
+    def run(self, activities, on_progress=None):
+        """
+        Elabora le attività e salva le corse a blocchi. on_progress(fatte, totali) è chiamato
+        dal thread chiamante (sicuro per gli elementi Streamlit). Ritorna le corse salvate.
+        """
+        if not activities: return []
+        todo = queue.Queue()
+        for s in activities: todo.put(s)
+        fetched, analyzed = queue.Queue(self.queue_size), queue.Queue(self.queue_size)
+
+        # Analisi di pochi ms per corsa: il pool conviene solo sui backfill lunghi
+        use_pool = self.cpu_workers > 0 and len(activities) >= Config.SYNC_PROCESS_MIN_RUNS
+        pool = _analysis_pool(self.cpu_workers) if use_pool else None
+
+        threads = [threading.Thread(target=self._fetcher, args=(todo, fetched), daemon=True) for _ in range(self.fetch_workers)]
+        threads.append(threading.Thread(target=self._dispatcher, args=(fetched, analyzed, pool), daemon=True))
+        for th in threads: th.start()
+
+        saved, batch, done = [], [], 0
+        while True:
+            item = analyzed.get()
+            if item is _DONE: break
+            s, fut, data = item
+            try:
+                try:
+                    res = fut.result() if fut else None
+                except BrokenProcessPool: # Analisi già inviate a un pool che si è rotto: si rifanno qui
+                    if pool: _drop_pool(pool)
+                    res = analyze_activity(s, data[0], data[1], self.params)
+            except Exception as e:
+                print(f"Error processing {s['id']}: {e}")
+                res = None
+            if res:
+                res.update(Fingerprint=summary_fingerprint(s), Stream_ETag=data[2])
+                if self.baseline is not None:
+                    res['Digest']['baseline'] = self.baseline.compare(res)
+                    self.baseline.add(res)
+                batch.append(res)
+            if len(batch) >= self.write_batch: self._flush(batch, saved)
+            done += 1
+            if on_progress: on_progress(done, len(activities))
+        self._flush(batch, saved)
+        return saved
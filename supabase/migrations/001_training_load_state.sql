@@ -0,0 +1,9 @@
+-- Carico per corsa (modello Fitness/Fatica/Forma) e stato incrementale per atleta
+-- (CTL/ATL, inviluppo potenza). Idempotente: si può rieseguire.
+
+ALTER TABLE runs ADD COLUMN IF NOT EXISTS load real;
+
+CREATE TABLE IF NOT EXISTS athlete_state (
+    athlete_id bigint PRIMARY KEY,
+    state jsonb NOT NULL
+);
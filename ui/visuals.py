@@ -84,6 +84,105 @@ def render_scatter_chart(watts, hr):
     
     st.altair_chart(chart, use_container_width=True)
 
+def render_drift_chart(curve):
+    """
+    Curva di deriva aerobica (Potenza/FC su finestre scorrevoli).
+    """
+    st.markdown("##### 📉 Deriva Aerobica nel Tempo")
+    if not curve or not curve.get("drift"):
+        st.info("Corsa troppo breve per la curva di deriva.")
+        return
+
+    df = pd.DataFrame({'Minuto': curve['t_min'], 'Deriva (%)': [round(d*100, 1) for d in curve['drift']]})
+
+    line = alt.Chart(df).mark_line(color='#6C5DD3', strokeWidth=3).encode(
+        x=alt.X('Minuto', title='Minuti'),
+        y=alt.Y('Deriva (%)', title=None),
+        tooltip=['Minuto', 'Deriva (%)']
+    )
+    # Soglia di normalità del disaccoppiamento (5%)
+    rule = alt.Chart(pd.DataFrame({'y': [5]})).mark_rule(color='#FF8080', strokeDash=[4, 4]).encode(y='y')
+
+    chart = (line + rule).properties(
+        height=200
+    ).configure_axis(
+        grid=False,
+        domain=False,
+        labelColor='#B2BEC3',
+        titleColor='#636E72'
+    ).configure_view(strokeWidth=0)
+
+    st.altair_chart(chart, use_container_width=True)
+    st.caption(f"Finestra peggiore: {round(curve.get('worst', 0)*100, 1)}%")
+
+def render_power_curve_chart(durations, run_mmp, envelope):
+    """
+    Curva potenza media-massimale: corsa selezionata vs record 90gg e assoluti (scala log).
+    """
+    st.markdown("##### 🏅 Best Efforts (Curva di Potenza)")
+    series = {"Questa corsa": run_mmp.get('watts', []) if run_mmp else [],
+              "Ultimi 90gg": envelope.get('rolling', []), "Record": envelope.get('all_time', [])}
+    rows = [{'Durata (s)': d, 'Watt': w, 'Curva': name}
+            for name, values in series.items() for d, w in zip(durations, values) if w is not None]
+    if not rows:
+        st.info("Dati di potenza non disponibili.")
+        return
+
+    df = pd.DataFrame(rows)
+    chart = alt.Chart(df).mark_line(point=True).encode(
+        x=alt.X('Durata (s)', scale=alt.Scale(type='log'), title='Durata (s)'),
+        y=alt.Y('Watt', scale=alt.Scale(zero=False), title=None),
+        color=alt.Color('Curva', scale=alt.Scale(domain=list(series.keys()), range=['#FF8080', '#6C5DD3', '#B2BEC3']),
+                        legend=alt.Legend(orient='bottom', title=None)),
+        tooltip=['Curva', 'Durata (s)', 'Watt']
+    ).properties(
+        height=250
+    ).configure_axis(
+        grid=False,
+        domain=False,
+        labelColor='#B2BEC3',
+        titleColor='#636E72'
+    ).configure_view(strokeWidth=0)
+
+    st.altair_chart(chart, use_container_width=True)
+
+def render_segments_chart(watts, segments, dt=1.0):
+    """
+    Potenza nel tempo con i blocchi di lavoro evidenziati (interval detection).
+    """
+    st.markdown("##### 🧱 Struttura Seduta (Lavoro/Recupero)")
+    if not watts or not segments:
+        st.info("Struttura non disponibile.")
+        return
+
+    # Stream ridotto a ~600 punti per il grafico
+    step = max(1, len(watts) // 600)
+    df = pd.DataFrame({'Minuto': [i * dt / 60 for i in range(0, len(watts), step)], 'Watts': watts[::step]})
+    blocks = pd.DataFrame([{'start': s['start_s'] / 60, 'end': (s['start_s'] + s['dur_s']) / 60,
+                            'Tipo': s['type'], 'Watt medi': s['avg_w']} for s in segments if s['type'] == 'work'])
+
+    line = alt.Chart(df).mark_line(color='#B2BEC3', strokeWidth=1).encode(
+        x=alt.X('Minuto', title='Minuti'),
+        y=alt.Y('Watts', title=None, scale=alt.Scale(zero=False))
+    )
+    chart = line
+    if not blocks.empty:
+        rects = alt.Chart(blocks).mark_rect(color='#FF8080', opacity=0.3).encode(
+            x='start', x2='end', tooltip=['Tipo', 'Watt medi']
+        )
+        chart = rects + line
+
+    chart = chart.properties(
+        height=200
+    ).configure_axis(
+        grid=False,
+        domain=False,
+        labelColor='#B2BEC3',
+        titleColor='#636E72'
+    ).configure_view(strokeWidth=0)
+
+    st.altair_chart(chart, use_container_width=True)
+
 def render_history_table(df):
     """
     Tabella interattiva con le ultime attività.